@@ -0,0 +1,451 @@
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import util
+import vectorizer
+import classifier
+import evaluation
+import model
+import service
+import variants
+import utilpt2
+
+def time_function(function, repeat=3):
+    """ Returns the best wall time in seconds of repeat calls to function() """
+    best = float('inf')
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def benchmark_tokenizers(file_list, repeat=3):
+    """
+    Time util.get_words_in_file against the byte-level tokenizers on every file
+    in file_list, after checking that they find the same words.
+    Returns a dict whose keys are tokenizer names and whose values are seconds.
+    """
+    for f in file_list:
+        words = [w.encode('ISO-8859-1') for w in util.get_words_in_file(f, 'str')]
+        if words != util.get_byte_words_in_file(f):
+            raise AssertionError("Byte tokenizer disagrees with get_words_in_file on %s"
+                                 % util.get_document_name(f))
+
+    def str_words():
+        for f in file_list:
+            util.get_words_in_file(f, 'str')
+
+    def decoded_byte_words():
+        for f in file_list:
+            util.get_words_in_file(f, 'bytes')
+
+    def byte_words():
+        for f in file_list:
+            util.get_byte_words_in_file(f)
+
+    def word_ids():
+        vocabulary = dict()
+        for f in file_list:
+            util.get_word_ids_in_file(f, vocabulary)
+
+    return {'get_words_in_file': time_function(str_words, repeat),
+            "get_words_in_file 'bytes'": time_function(decoded_byte_words, repeat),
+            'get_byte_words_in_file': time_function(byte_words, repeat),
+            'get_word_ids_in_file': time_function(word_ids, repeat)}
+
+
+def get_model_size(nb_model):
+    """ Returns the approximate number of bytes of the parameters and vocabulary of nb_model """
+    size = nb_model.log_likelihoods.nbytes + nb_model.log_prior.nbytes
+    if isinstance(nb_model.vocabulary, vectorizer.Vocabulary):
+        size += sum(sys.getsizeof(w) for w in nb_model.vocabulary.words)
+        size += sys.getsizeof(nb_model.vocabulary) + sys.getsizeof(nb_model.vocabulary.words)
+    return size
+
+def evaluate_model(nb_model, test_files, repeat=3):
+    """
+    Returns a dict with the accuracy of nb_model on test_files (zeta = 1), its
+    batch scoring throughput in files/s and its mean latency in ms when 
+    scoring one email at a time with classifier.classify_email
+    """
+    seconds = time_function(lambda: classifier.classify_batch(test_files, nb_model, 1), repeat)
+    latency = time_function(lambda: [classifier.classify_email(f, nb_model, 1) for f in test_files], repeat)
+    log_posteriors, true_labels = evaluation.score_files(test_files, nb_model)
+    performance_measures = evaluation.get_performance_measures(log_posteriors, true_labels, 1)
+    return {'accuracy': performance_measures.trace()/performance_measures.sum(),
+            'files_per_second': len(test_files)/seconds,
+            'latency_ms': 1000*latency/len(test_files)}
+
+def benchmark_hashing(file_lists_by_category, test_files, bits=(10, 14, 18, 22), repeat=3):
+    """
+    Compare the exact vocabulary model of classifier.learn_model with hashed
+    models of 2**k buckets for every k in bits. Returns a list with one dict
+    per model holding its name, model size, training time, accuracy and 
+    scoring throughput.
+    """
+    vocabularies = [('exact', lambda: None)]
+    for k in bits:
+        vocabularies.append(('hashing 2^%d' % k, lambda k=k: vectorizer.HashingVocabulary(k)))
+
+    results = []
+    for name, make_vocabulary in vocabularies:
+        start = time.perf_counter()
+        nb_model = classifier.learn_model(file_lists_by_category, [0.5, 0.5], vocabulary=make_vocabulary())
+        result = {'name': name, 'model_bytes': get_model_size(nb_model),
+                  'train_seconds': time.perf_counter() - start}
+        result.update(evaluate_model(nb_model, test_files, repeat))
+        results.append(result)
+    return results
+
+
+def benchmark_feature_selection(file_lists_by_category, test_files, num_features=(100, 1000, 5000, 20000, None),
+                                method='mutual_information', repeat=3):
+    """
+    Count the training files once, then keep the best N words by method for
+    every N in num_features (None keeps all of them). Returns a list with one
+    dict per N holding the model size, accuracy, scoring throughput and 
+    latency, see evaluate_model.
+    """
+    vocabulary, count_matrix, labels = vectorizer.get_count_matrix_by_category(file_lists_by_category)
+    results = []
+    for n in num_features:
+        selected_vocabulary, probabilities = classifier.estimate_probability_vectors(
+            vocabulary, count_matrix, labels, len(file_lists_by_category), n, method)
+        nb_model = model.make_model(selected_vocabulary, probabilities, [0.5, 0.5])
+        result = {'num_features': len(selected_vocabulary), 'model_bytes': get_model_size(nb_model)}
+        result.update(evaluate_model(nb_model, test_files, repeat))
+        results.append(result)
+    return results
+
+
+def benchmark_workers(file_list, nb_model, max_workers, chunk_size=256, repeat=3):
+    """
+    Time service.classify_parallel over file_list with 1 to max_workers
+    worker processes. Returns a list with the files/s of every worker count.
+    """
+    throughputs = []
+    for workers in range(1, max_workers + 1):
+        seconds = time_function(lambda: list(service.classify_parallel(file_list, nb_model, 1, workers, chunk_size)),
+                                repeat)
+        throughputs.append(len(file_list)/seconds)
+    return throughputs
+
+def benchmark_variants(file_lists_by_category, test_files, repeat=3):
+    """
+    Train every variant of variants.TRAINERS from one count matrix and score
+    test_files with each. Returns a list with one dict per variant holding its
+    name, training time (from the count matrix), accuracy and scoring
+    throughput, both with the tokenization of test_files included and of the
+    product alone.
+    """
+    vocabulary, count_matrix, labels = vectorizer.get_count_matrix_by_category(file_lists_by_category)
+    true_labels = evaluation.get_true_labels(test_files)
+    test_matrix = vectorizer.get_count_matrix(vectorizer.get_word_counts(test_files), vocabulary, grow=False)
+    results = []
+    for name, train in variants.TRAINERS.items():
+        start = time.perf_counter()
+        linear_model = train(vocabulary, count_matrix, labels, [0.5, 0.5])
+        train_seconds = time.perf_counter() - start
+        predictions = variants.classify_count_matrix(linear_model, test_matrix)
+        seconds = time_function(lambda: variants.classify_batch(test_files, {name: linear_model}), repeat)
+        product_seconds = time_function(lambda: variants.classify_count_matrix(linear_model, test_matrix), repeat)
+        results.append({'name': name, 'train_seconds': train_seconds,
+                        'accuracy': np.mean(predictions == true_labels),
+                        'files_per_second': len(test_files)/seconds,
+                        'matrix_files_per_second': len(test_files)/product_seconds})
+    return results
+
+def get_peak_rss_mb():
+    """ Returns the peak resident set size of this process so far, in MB """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak/2**20 if sys.platform == 'darwin' else peak/2**10
+
+def get_words(vocabulary_size):
+    """ Returns vocabulary_size distinct lowercase words: a, b, ..., z, aa, ab, ... """
+    words = []
+    for i in range(vocabulary_size):
+        word = ''
+        i += 1
+        while i:
+            i, letter = divmod(i - 1, 26)
+            word = chr(ord('a') + letter) + word
+        words.append(word)
+    return words
+
+def generate_corpus(folder, num_documents, vocabulary_size=50000, words_per_document=200, spam_fraction=0.5,
+                    seed=0, batch_size=10000):
+    """
+    Write a synthetic corpus of num_documents emails to folder/spam and
+    folder/ham, named like the real data (e.g. 0000042.spam.txt), and return
+    (spam files, ham files)
+
+    The words of both categories follow a Zipf law over the same vocabulary
+    of vocabulary_size words, but a random 10% of the ranks are shuffled
+    between the two, so the categories are separable. Document lengths are
+    Poisson with mean words_per_document. A corpus already in folder with the
+    same parameters (recorded in folder/corpus.json) is reused; otherwise
+    folder/spam and folder/ham are emptied first.
+    """
+    parameters = {'num_documents': num_documents, 'vocabulary_size': vocabulary_size,
+                  'words_per_document': words_per_document, 'spam_fraction': spam_fraction, 'seed': seed}
+    manifest = os.path.join(folder, 'corpus.json')
+    spam_folder = os.path.join(folder, 'spam')
+    ham_folder = os.path.join(folder, 'ham')
+    if os.path.exists(manifest):
+        with open(manifest) as f:
+            if json.load(f) == parameters:
+                return [util.get_files_in_folder(spam_folder), util.get_files_in_folder(ham_folder)]
+        os.remove(manifest)
+    # remove the files of a corpus with other parameters, or of an interrupted run
+    for category_folder in (spam_folder, ham_folder):
+        if os.path.isdir(category_folder):
+            shutil.rmtree(category_folder)
+
+    rng = np.random.RandomState(seed)
+    words = np.array(get_words(vocabulary_size), dtype=object)
+    ham_cdf = np.cumsum(1/np.arange(1, vocabulary_size + 1)**1.1)
+    ham_cdf /= ham_cdf[-1]
+    # spam draws ranks from the same law, through a permutation of 10% of the words
+    spam_words = words.copy()
+    shuffled = rng.choice(vocabulary_size, vocabulary_size//10, replace=False)
+    spam_words[shuffled] = spam_words[rng.permutation(shuffled)]
+
+    file_lists = [[], []]
+    for category_folder in (spam_folder, ham_folder):
+        os.makedirs(category_folder, exist_ok=True)
+    for start in range(0, num_documents, batch_size):
+        count = min(batch_size, num_documents - start)
+        is_spam = rng.random_sample(count) < spam_fraction
+        lengths = rng.poisson(words_per_document, count)
+        ranks = np.searchsorted(ham_cdf, rng.random_sample(lengths.sum()))
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        for i in range(count):
+            spam = is_spam[i]
+            document = (spam_words if spam else words)[ranks[offsets[i]:offsets[i + 1]]]
+            category = 'spam' if spam else 'ham'
+            filename = os.path.join(folder, category, '%07d.%s.txt' % (start + i, category))
+            with open(filename, 'w', encoding='ISO-8859-1') as f:
+                f.write(' '.join(document))
+            file_lists[0 if spam else 1].append(filename)
+
+    with open(manifest, 'w') as f:
+        json.dump(parameters, f)
+    return file_lists
+
+STAGES = ['tokenize', 'learn_distributions', 'classify_batch']
+
+def benchmark_stage(stage, file_lists_by_category, model_file=None):
+    """
+    Time one stage of the classifier on a corpus, once: 'tokenize'
+    (util.get_words_in_file on every file), 'learn_distributions'
+    (classifier.learn_distributions) or 'classify_batch' (batch scoring of
+    every file with the model saved in model_file by model.save_model, read
+    back into memory).
+    Returns a dict with its seconds, documents/s, the peak RSS of the process
+    in MB when the stage is done, and the growth of that peak during the
+    stage. Run every stage in a fresh process, as run_suite does, so that
+    the peak belongs to that stage alone.
+    """
+    file_list = file_lists_by_category[0] + file_lists_by_category[1]
+    if stage == 'tokenize':
+        function = lambda: sum(len(util.get_words_in_file(f)) for f in file_list)
+    elif stage == 'learn_distributions':
+        function = lambda: classifier.learn_distributions(file_lists_by_category)
+    elif stage == 'classify_batch':
+        # score with an in-memory model, as one made by classifier.learn_model,
+        # rather than with the mapped vocabulary of the file
+        loaded = model.load_model(model_file)
+        nb_model = model.NaiveBayesModel(loaded.categories, vectorizer.Vocabulary(loaded.vocabulary),
+                                         np.array(loaded.log_likelihoods), np.array(loaded.log_prior))
+        function = lambda: classifier.classify_batch(file_list, nb_model, 1)
+    else:
+        raise ValueError("Unknown stage: %s" % stage)
+
+    baseline_rss = get_peak_rss_mb()
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    peak_rss = get_peak_rss_mb()
+    return {'seconds': seconds, 'documents_per_second': len(file_list)/seconds,
+            'peak_rss_mb': peak_rss, 'peak_rss_increase_mb': peak_rss - baseline_rss}
+
+def _prepare_corpus(args):
+    """ Generate (or reuse) a corpus and save the model trained on it, in a worker process """
+    folder, num_documents, vocabulary_size = args
+    file_lists = generate_corpus(folder, num_documents, vocabulary_size)
+    model_file = os.path.join(folder, 'model.bin')
+    model.save_model(classifier.learn_model(file_lists, [0.5, 0.5]), model_file)
+    return model_file
+
+def _benchmark_stage(args):
+    """ Benchmark one stage on a prepared corpus, in a worker process """
+    stage, folder, num_documents, vocabulary_size, model_file = args
+    file_lists = generate_corpus(folder, num_documents, vocabulary_size)
+    return benchmark_stage(stage, file_lists, model_file)
+
+def get_revision():
+    """ Returns the git commit of the working tree, or None """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(sizes=(1000, 10000, 100000), vocabulary_size=50000, folder=None):
+    """
+    Benchmark every stage of STAGES (see benchmark_stage) on synthetic
+    corpora of every size in sizes. The corpus and its model are prepared in
+    one process, and every stage then runs in a fresh process of its own, so
+    that its peak RSS includes neither the other stages nor the preparation. Corpora are kept in folder (by default in the
+    temporary directory) and reused by later runs. Returns a dict that can be
+    stored with json.dump and compared with compare_results.
+    """
+    folder = folder or os.path.join(tempfile.gettempdir(), 'nb_benchmark')
+    results = {'revision': get_revision(), 'python': sys.version.split()[0],
+               'vocabulary_size': vocabulary_size, 'runs': []}
+    context = multiprocessing.get_context('spawn')
+    for n in sizes:
+        corpus_folder = os.path.join(folder, '%d_%d' % (n, vocabulary_size))
+        with context.Pool(1) as pool:
+            model_file = pool.apply(_prepare_corpus, ((corpus_folder, n, vocabulary_size),))
+        run = {'documents': n}
+        for stage in STAGES:
+            with context.Pool(1) as pool:
+                run[stage] = pool.apply(_benchmark_stage, ((stage, corpus_folder, n, vocabulary_size, model_file),))
+        results['runs'].append(run)
+    return results
+
+def compare_results(old, new):
+    """
+    Returns a list of (documents, stage, old seconds, new seconds) for every
+    stage of every corpus size that both result dicts of run_suite have
+    """
+    old_runs = dict((run['documents'], run) for run in old['runs'])
+    comparison = []
+    for run in new['runs']:
+        if run['documents'] in old_runs:
+            for stage in STAGES:
+                comparison.append((run['documents'], stage, old_runs[run['documents']][stage]['seconds'],
+                                   run[stage]['seconds']))
+    return comparison
+
+def benchmark_density_Gaussian(num_samples=(1000, 10000, 100000), dimensions=(2, 10, 50), repeat=3, seed=0):
+    """
+    Time utilpt2.density_Gaussian against the per-sample loop of
+    utilpt2.density_Gaussian_loop on random samples of every size and
+    dimension, after checking that they agree. Returns a list of dicts with
+    the size, dimension, seconds of both and the speedup.
+    """
+    rng = np.random.RandomState(seed)
+    results = []
+    for d in dimensions:
+        A = rng.randn(d, d)
+        covariance = A @ A.T + d*np.eye(d)
+        mean = rng.randn(d)
+        for n in num_samples:
+            x_set = mean + rng.randn(n, d) @ np.linalg.cholesky(covariance).T
+            expected = utilpt2.density_Gaussian_loop(mean, covariance, x_set)
+            if not np.allclose(utilpt2.density_Gaussian(mean, covariance, x_set), expected, rtol=1e-8, atol=0):
+                raise AssertionError("density_Gaussian disagrees with the loop for n = %d, d = %d" % (n, d))
+            loop_seconds = time_function(lambda: utilpt2.density_Gaussian_loop(mean, covariance, x_set), repeat)
+            seconds = time_function(lambda: utilpt2.density_Gaussian(mean, covariance, x_set), repeat)
+            results.append({'samples': n, 'dimension': d, 'loop_seconds': loop_seconds, 'seconds': seconds,
+                            'speedup': loop_seconds/seconds})
+    return results
+
+
+if __name__ == '__main__':
+    # usage: python benchmark.py tokenize [folder or packed corpus ...]
+    #        python benchmark.py hashing
+    #        python benchmark.py selection [mutual_information or chi_squared]
+    #        python benchmark.py workers [max workers]
+    #        python benchmark.py variants
+    #        python benchmark.py suite [results.json] [number of documents ...]
+    #        python benchmark.py compare old.json new.json
+    #        python benchmark.py gaussian
+    command = sys.argv[1] if len(sys.argv) > 1 else 'tokenize'
+    
+    if command == 'tokenize':
+        folders = sys.argv[2:] or ["data/spam", "data/ham"]
+        file_list = []
+        for folder in folders:
+            file_list.extend(util.get_files_in_folder(folder))
+
+        print("Tokenizing %d files..." % len(file_list))
+        for name, seconds in benchmark_tokenizers(file_list).items():
+            print("%-24s %8.3f s %10.0f files/s" % (name, seconds, len(file_list)/seconds))
+
+    elif command == 'hashing':
+        file_lists = [util.get_files_in_folder("data/spam"), util.get_files_in_folder("data/ham")]
+        test_files = util.get_files_in_folder("data/testing")
+        results = benchmark_hashing(file_lists, test_files)
+        print("%-14s %12s %10s %9s %12s" % ('model', 'size (bytes)', 'train (s)', 'accuracy', 'files/s'))
+        for r in results:
+            print("%-14s %12d %10.3f %9.3f %12.0f" % (r['name'], r['model_bytes'], r['train_seconds'],
+                                                      r['accuracy'], r['files_per_second']))
+
+    elif command == 'selection':
+        method = sys.argv[2] if len(sys.argv) > 2 else 'mutual_information'
+        file_lists = [util.get_files_in_folder("data/spam"), util.get_files_in_folder("data/ham")]
+        test_files = util.get_files_in_folder("data/testing")
+        results = benchmark_feature_selection(file_lists, test_files, method=method)
+        print("%10s %12s %9s %12s %12s" % ('words', 'size (bytes)', 'accuracy', 'files/s', 'latency (ms)'))
+        for r in results:
+            print("%10d %12d %9.3f %12.0f %12.3f" % (r['num_features'], r['model_bytes'], r['accuracy'],
+                                                     r['files_per_second'], r['latency_ms']))
+
+    elif command == 'workers':
+        max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+        file_lists = [util.get_files_in_folder("data/spam"), util.get_files_in_folder("data/ham")]
+        nb_model = classifier.learn_model(file_lists, [0.5, 0.5])
+        file_list = file_lists[0] + file_lists[1]
+        print("%8s %12s %8s" % ('workers', 'files/s', 'speedup'))
+        throughputs = benchmark_workers(file_list, nb_model, max_workers)
+        for workers, throughput in enumerate(throughputs, 1):
+            print("%8d %12.0f %8.2f" % (workers, throughput, throughput/throughputs[0]))
+
+    elif command == 'variants':
+        file_lists = [util.get_files_in_folder("data/spam"), util.get_files_in_folder("data/ham")]
+        test_files = util.get_files_in_folder("data/testing")
+        print("%-12s %10s %9s %12s %16s" % ('variant', 'train (s)', 'accuracy', 'files/s', 'matrix files/s'))
+        for r in benchmark_variants(file_lists, test_files):
+            print("%-12s %10.4f %9.3f %12.0f %16.0f" % (r['name'], r['train_seconds'], r['accuracy'],
+                                                       r['files_per_second'], r['matrix_files_per_second']))
+
+    elif command == 'suite':
+        output = sys.argv[2] if len(sys.argv) > 2 else 'benchmark.json'
+        sizes = [int(n) for n in sys.argv[3:]] or [1000, 10000, 100000]
+        results = run_suite(sizes)
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print("%10s %-20s %10s %12s %14s %16s" % ('documents', 'stage', 'seconds', 'documents/s',
+                                                 'peak RSS (MB)', 'stage growth (MB)'))
+        for run in results['runs']:
+            for stage in STAGES:
+                r = run[stage]
+                print("%10d %-20s %10.3f %12.0f %14.1f %16.1f" % (run['documents'], stage, r['seconds'],
+                                                                  r['documents_per_second'], r['peak_rss_mb'],
+                                                                  r['peak_rss_increase_mb']))
+
+    elif command == 'compare':
+        with open(sys.argv[2]) as f:
+            old = json.load(f)
+        with open(sys.argv[3]) as f:
+            new = json.load(f)
+        print("%10s %-20s %10s %10s %8s" % ('documents', 'stage', 'old (s)', 'new (s)', 'speedup'))
+        for n, stage, old_seconds, new_seconds in compare_results(old, new):
+            print("%10d %-20s %10.3f %10.3f %8.2f" % (n, stage, old_seconds, new_seconds, old_seconds/new_seconds))
+
+    elif command == 'gaussian':
+        print("%10s %10s %12s %12s %8s" % ('samples', 'dimension', 'loop (s)', 'batched (s)', 'speedup'))
+        for r in benchmark_density_Gaussian():
+            print("%10d %10d %12.4f %12.4f %8.1f" % (r['samples'], r['dimension'], r['loop_seconds'],
+                                                    r['seconds'], r['speedup']))
@@ -0,0 +1,131 @@
+from collections import OrderedDict
+import hashlib
+import os
+import numpy as np
+import util
+import corpus
+import classifier
+import model
+
+# number of bytes of a content hash
+KEY_SIZE = 16
+
+def get_content_hash(data):
+    """ Returns a 16 byte BLAKE2b digest of the bytes of an email """
+    return hashlib.blake2b(data, digest_size=KEY_SIZE).digest()
+
+class ResultCache(object):
+    """
+    A bounded LRU cache of log posteriors, keyed by the content hash of the
+    email bytes.
+
+    The cache belongs to one model version (see model.get_model_version) and
+    multinomial coefficient mode; set_model with a different model empties
+    it. The log posteriors do not depend on zeta, so the label is derived
+    from them at lookup time. If filename is given, the cache is loaded from
+    it (if it exists and has the right version) and save() writes it back.
+    """
+    def __init__(self, maxsize=100000, filename=None):
+        self.maxsize = maxsize
+        self.filename = filename
+        self.entries = OrderedDict()
+        self.version = None
+        self.nb_model = None
+        self.multinomial_coef = None
+        self.hits = 0
+        self.misses = 0
+        if filename is not None and os.path.exists(filename):
+            self.load()
+
+    def set_model(self, nb_model, multinomial_coef='lgamma'):
+        """ Bind the cache to nb_model, dropping all entries if its version changed """
+        version = model.get_model_version(nb_model) + multinomial_coef
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+        self.nb_model = nb_model
+        self.multinomial_coef = multinomial_coef
+
+    def get(self, key):
+        """ Returns the cached log posterior of key, or None """
+        log_posterior = self.entries.get(key)
+        if log_posterior is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return log_posterior
+
+    def put(self, key, log_posterior):
+        self.entries[key] = log_posterior
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def get_stats(self):
+        """ Returns a dict with the size, hits, misses and hit rate of the cache """
+        lookups = self.hits + self.misses
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits/lookups if lookups else 0.0}
+
+    def load(self):
+        """
+        Read the entries saved in the cache file, least recently used first.
+        They are kept only until set_model is called with a model of another
+        version.
+        """
+        with np.load(self.filename, allow_pickle=False) as saved:
+            version = str(saved['version'])
+            keys = saved['keys']
+            log_posteriors = saved['log_posteriors']
+        if keys.shape != (len(log_posteriors), KEY_SIZE) or log_posteriors.shape[1:] != (2,):
+            raise ValueError("%s is not a saved result cache" % self.filename)
+        self.version = version or None
+        self.entries.clear()
+        for key, log_posterior in zip(keys[-self.maxsize:], log_posteriors[-self.maxsize:].tolist()):
+            self.entries[key.tobytes()] = log_posterior
+
+    def save(self):
+        """
+        Write the cache to its file as a .npz archive: the version, the keys
+        as an N x 16 array of bytes and the log posteriors as an N x 2 array
+        """
+        keys = np.frombuffer(b''.join(self.entries.keys()), dtype=np.uint8).reshape(-1, KEY_SIZE)
+        log_posteriors = np.array(list(self.entries.values()), dtype=np.float64).reshape(-1, 2)
+        with open(self.filename, 'wb') as f:
+            np.savez(f, version=np.array(self.version or ''), keys=keys, log_posteriors=log_posteriors)
+
+def classify_cached(file_list, nb_model, cache, zeta=1, multinomial_coef='lgamma'):
+    """
+    Same as classifier.classify_batch, but every email is looked up in cache
+    by the hash of its bytes first. Only the misses are scored (in one
+    batch), and their log posteriors are added to the cache.
+    """
+    if cache.nb_model is not nb_model or cache.multinomial_coef != multinomial_coef:
+        cache.set_model(nb_model, multinomial_coef)
+
+    log_posteriors = []
+    misses = []
+    for i, f in enumerate(file_list):
+        data = util.get_bytes_in_file(f)
+        key = get_content_hash(data)
+        log_posterior = cache.get(key)
+        if log_posterior is None:
+            misses.append((i, key, corpus.PackedDocument(util.get_document_name(f), data)))
+        log_posteriors.append(log_posterior)
+
+    if misses:
+        documents = [document for i, key, document in misses]
+        for (i, key, document), (label, log_posterior) in zip(
+                misses, classifier.classify_batch(documents, nb_model, zeta, multinomial_coef)):
+            cache.put(key, log_posterior)
+            log_posteriors[i] = log_posterior
+
+    positive, negative = nb_model.categories
+    classify_results = []
+    for p_y1, p_y0 in log_posteriors:
+        if(p_y1 >= zeta*p_y0):
+            classify_results.append((positive, [p_y1, p_y0]))
+        else:
+            classify_results.append((negative, [p_y1, p_y0]))
+    return classify_results
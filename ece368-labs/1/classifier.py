@@ -1,81 +1,238 @@
-import os.path
 import numpy as np
 import util
+import vectorizer
+import model
+import parallel
+import selection
+import instrument
 import math
+from array import array
 import matplotlib.pyplot as plt
+from scipy import special
 
-def learn_distributions(file_lists_by_category):
+LN_10 = math.log(10)
+
+def smooth_class_counts(class_counts, alpha=1):
+    """
+    Perform laplace smoothing on all words at once. class_counts is a
+    K x len(vocabulary) array of per-category word counts; returns the array of
+    smoothed probabilities (count + alpha)/(total count of the category + alpha*|W|)
+    
+    |W| is the number of columns with a nonzero count. Columns no training
+    word falls into (only possible with a vectorizer.HashingVocabulary) get
+    probability 1 in every category, so that, like words outside the 
+    vocabulary, they do not affect the scores.
+    """
+    with instrument.stage('smooth'):
+        occupied = class_counts.sum(axis=0) > 0
+        laplace_smooth_word_counts = class_counts.sum(axis=1) + alpha*np.count_nonzero(occupied)
+        probabilities = (class_counts + alpha)/laplace_smooth_word_counts[:, np.newaxis]
+        probabilities[:, ~occupied] = 1
+        return probabilities
+
+
+def estimate_probability_vectors(vocabulary, count_matrix, labels, num_categories,
+                                 num_features=None, selection_method='mutual_information'):
+    """
+    Estimate the smoothed word probabilities from a document-term matrix
+
+    Input
+    -----
+    vocabulary, count_matrix, labels: output of vectorizer.get_count_matrix_by_category
+    num_categories: number of categories K
+    num_features: if given, only the num_features words ranked best by
+    selection_method ('mutual_information' or 'chi_squared', see
+    selection.select_features) are kept before the probabilities are estimated
+
+    Output
+    ------
+    A tuple of two elements: (vocabulary, probabilities), see learn_probability_vectors
+    """
+    if num_features is not None:
+        print("Selecting features...")
+        word_ids = selection.select_features(count_matrix, labels, num_categories, num_features,
+                                             selection_method)
+        vocabulary, count_matrix = selection.prune_vocabulary(vocabulary, count_matrix, word_ids)
+    
+    ### Sum the rows of each category with one matrix reduction
+    class_counts = vectorizer.get_class_counts(count_matrix, labels, num_categories)
+    
+    print("Generating posterior probabilities...")
+    return (vocabulary, smooth_class_counts(class_counts))
+
+
+def learn_probability_vectors(file_lists_by_category, workers=1, vocabulary=None,
+                              num_features=None, selection_method='mutual_information'):
+    """
+    Estimate the Laplace smoothed word probabilities of every category as dense
+    vectors over an integer-indexed vocabulary
+    
+    Input
+    -----
+    file_lists_by_category: A list with one list of files per category, e.g.
+    [spam files, ham files].
+    workers: number of processes used to tokenize and count the files. With
+    more than one (or None, for one per CPU) the counting is done by
+    parallel.get_class_counts_parallel; the result is identical either way
+    vocabulary: An optional vectorizer.Vocabulary to extend, or a 
+    vectorizer.HashingVocabulary for a fixed-size model over hashed words
+    num_features, selection_method: keep only the best num_features words, see
+    estimate_probability_vectors. Needs the per-document counts, so it cannot
+    be combined with workers and a HashingVocabulary
+
+    Output
+    ------
+    A tuple of two elements: (vocabulary, probabilities), in which vocabulary is
+    a vectorizer.Vocabulary mapping words to column ids, and probabilities is a
+    K x len(vocabulary) array whose row k holds the smoothed estimates for
+    category k (row 0 is p_d and row 1 is q_d)
+    """
+    if num_features is not None and (workers != 1 or isinstance(vocabulary, vectorizer.HashingVocabulary)):
+        raise ValueError("Feature selection needs workers=1 and an exact vocabulary")
+    
+    print("Counting words...")
+    if workers is None or workers > 1:
+        ### Map-reduce the word counts of shards of the files over a process pool
+        vocabulary, class_counts = parallel.get_class_counts_parallel(file_lists_by_category, workers,
+                                                                      vocabulary=vocabulary)
+        print("Generating posterior probabilities...")
+        return (vocabulary, smooth_class_counts(class_counts))
+    
+    if isinstance(vocabulary, vectorizer.HashingVocabulary):
+        ### Add the bucket counts of every file straight into the K x 2^k
+        ### class counts, so memory stays constant however large the corpus
+        class_counts = vectorizer.get_hashed_class_counts(file_lists_by_category, vocabulary)
+        print("Generating posterior probabilities...")
+        return (vocabulary, smooth_class_counts(class_counts))
+    
+    ### Tokenize every file once into a document-term matrix over the 
+    ### vocabulary W = {w1, w2, ..., wd}
+    vocabulary, count_matrix, labels = vectorizer.get_count_matrix_by_category(file_lists_by_category,
+                                                                               vocabulary)
+    return estimate_probability_vectors(vocabulary, count_matrix, labels, len(file_lists_by_category),
+                                        num_features, selection_method)
+
+
+def learn_distributions(file_lists_by_category, workers=1):
     """
     Estimate the parameters p_d, and q_d from the training set
     
     Input
     -----
     file_lists_by_category: A two-element list. The first element is a list of 
-    spam files, and the second element is a list of ham files.
+    spam files, and the second element is a list of ham files. Can also have
+    one list of files per category for K categories.
+    workers: number of processes used for counting, see learn_probability_vectors
 
     Output
     ------
-    probabilities_by_category: A two-element tuple. The first element is a dict 
+    probabilities_by_category: A two-element list. The first element is a dict 
     whose keys are words, and whose values are the smoothed estimates of p_d;
     the second element is a dict whose keys are words, and whose values are the 
-    smoothed estimates of q_d 
+    smoothed estimates of q_d. With K categories, one such dict per category.
     """
-    spam_files = file_lists_by_category[0]
-    ham_files = file_lists_by_category[1]
+    vocabulary, probabilities = learn_probability_vectors(file_lists_by_category, workers)
     
-    ### W is the vocabulary, W = {w1, w2, ..., wd}, generate this by going through all the files
-    print("Generating vocabulary...")
-    W = dict();
+    probabilities_by_category = [dict(zip(vocabulary.words, row)) for row in probabilities.tolist()]
     
-    for x in spam_files:
-        words = util.get_words_in_file(x)
-        for w in words:
-            W[w] = 1
+    return probabilities_by_category
+
+
+def learn_model(file_lists_by_category, prior_by_category, categories=('spam', 'ham'), workers=1,
+                vocabulary=None, num_features=None, selection_method='mutual_information'):
+    """
+    Estimate the parameters from the training set and store them, together
+    with the prior, in log space as a frozen model.NaiveBayesModel
     
-    for x in ham_files:
-        words = util.get_words_in_file(x)
-        for w in words:
-            W[w] = 1
+    Input
+    -----
+    file_lists_by_category: A two-element list. The first element is a list of 
+    spam files, and the second element is a list of ham files. Can also have
+    one list of files per category for K categories.
+    prior_by_category: A two-element list as [\\pi, 1-\\pi], or the K priors
+    categories: the names of the categories, one per list of files
+    workers: number of processes used for counting, see learn_probability_vectors
+    vocabulary: see learn_probability_vectors. Pass a vectorizer.HashingVocabulary
+    to bound the size of the model
+    num_features, selection_method: keep only the best num_features words, see
+    estimate_probability_vectors
+
+    Output
+    ------
+    model: a model.NaiveBayesModel, ready for classify_email and classify_batch
+    """
+    vocabulary, probabilities = learn_probability_vectors(file_lists_by_category, workers, vocabulary,
+                                                          num_features, selection_method)
+    return model.make_model(vocabulary, probabilities, prior_by_category, categories)
+
+
+def get_log_multinomial_coef(x, mode='exact'):
+    """
+    Returns log[(x1+x2+...xd)!/((x1!)(x2!)...(xd)!)] for the feature vector x,
+    a dict whose keys are words and whose values are word counts
+
+    mode selects how the coefficient is computed:
+    'exact': with exact integer factorials. Slow for long emails, since the
+             factorials have tens of thousands of digits
+    'lgamma': with math.lgamma, log(n!) = lgamma(n+1). Equal to 'exact' up to
+              floating point error
+    'drop': returns 0. The coefficient is the same for both categories, so
+            dropping it does not change which posterior is larger, but the
+            posteriors are no longer calibrated and decisions with zeta != 1
+            can change
+    """
+    if mode == 'drop':
+        return 0.0
     
-    ### generate p_d dict and q_d dict, perform laplace smoothing
-    print("Generating posterior probabilities...")
-    p_d = dict()
-    q_d = dict()
-    laplace_smooth_word_count_spam = util.get_total_word_count(spam_files) + len(W)
-    laplace_smooth_word_count_ham = util.get_total_word_count(ham_files) + len(W)
-    
-    wc_spam = dict()
-    for f in spam_files:
-        words = util.get_words_in_file(f)
-        for w in words:
-            if w in wc_spam:
-                wc_spam[w] += 1
-            else:
-                wc_spam[w] = 1
-            
-    wc_ham = dict()
-    for f in ham_files:
-        words = util.get_words_in_file(f)
-        for w in words:
-            if w in wc_ham:
-                wc_ham[w] += 1
-            else:
-                wc_ham[w] = 1
+    if mode == 'lgamma':
+        total_word_count = 0
+        log_denominator = 0.0
+        for w in x:
+            total_word_count += x[w]
+            log_denominator += math.lgamma(x[w] + 1)
+        return (math.lgamma(total_word_count + 1) - log_denominator)/LN_10
     
-    for w in W:
-        if w in wc_spam:
-            p_d[w] = (wc_spam[w] + 1)/(laplace_smooth_word_count_spam)
-        else:
-            p_d[w] = 1/laplace_smooth_word_count_spam
-            
-        if w in wc_ham:
-            q_d[w] = (wc_ham[w] + 1)/(laplace_smooth_word_count_ham)
-        else:
-            q_d[w] = 1/laplace_smooth_word_count_ham
-
-    probabilities_by_category = [p_d, q_d]
+    if mode != 'exact':
+        raise ValueError("Unknown multinomial coefficient mode: %s" % mode)
     
-    return probabilities_by_category
+    ### Calculate multinomial_coef = [(x1+x2+...xd)!]/[(x1!)(x2!)...(xd)!]
+    numerator = 0
+    for w in x:
+        numerator += x[w]
+    numerator = math.factorial(numerator)
+    
+    denominator = 1
+    for w in x:
+        denominator = denominator*math.factorial(x[w])  
+    
+    return math.log10(numerator) - math.log10(denominator)
+
+
+def record_log_multinomial_coefs(word_counts, mode, log_multinomial_coefs):
+    """
+    Yields every dict x of the iterable word_counts unchanged, after appending
+    get_log_multinomial_coef(x, mode) to log_multinomial_coefs (an
+    array('d')), so the coefficients of a stream of emails are computed as
+    the emails pass by and only one float per email is kept
+    """
+    for x in word_counts:
+        with instrument.stage('score'):
+            log_multinomial_coefs.append(get_log_multinomial_coef(x, mode))
+        yield x
+
+
+def get_log_multinomial_coefs_from_matrix(count_matrix):
+    """
+    Returns the 'lgamma' log multinomial coefficient of every row of a
+    document-term matrix built with a growing vocabulary (so that no words
+    of the documents were dropped)
+    """
+    count_matrix = count_matrix.tocsr()
+    rows = np.repeat(np.arange(count_matrix.shape[0]), np.diff(count_matrix.indptr))
+    counts = count_matrix.data.astype(np.float64)
+    total_word_counts = np.bincount(rows, weights=counts, minlength=count_matrix.shape[0])
+    log_denominators = np.bincount(rows, weights=special.gammaln(counts + 1), minlength=count_matrix.shape[0])
+    return (special.gammaln(total_word_counts + 1) - log_denominators)/LN_10
 
 
 def classify_new_email(filename,probabilities_by_category,prior_by_category, zeta):
@@ -97,55 +254,171 @@ def classify_new_email(filename,probabilities_by_category,prior_by_category, zet
     representing the log posterior probabilities
     """
     ### Construct the feature vector x
-    x = dict()
     words = util.get_words_in_file(filename)
-    for w in words:
-        if w in x:
-            x[w] += 1
-        else:
-            x[w] = 1
+    with instrument.stage('count'):
+        x = dict()
+        for w in words:
+            if w in x:
+                x[w] += 1
+            else:
+                x[w] = 1
     
-    ### Calculate multinomial_coef = [(x1+x2+...xd)!]/[(x1!)(x2!)...(xd)!]
-    numerator = 0
-    for w in x:
-        numerator += x[w]
-    numerator = math.factorial(numerator)
+    with instrument.stage('score'):
+        log_multinomial_coef = get_log_multinomial_coef(x)
+        
+        ### Posterior of being spam: log[ p(y=1|x) ]= log[ p(x|y=1)*p(y=1) ]
+        p_d = probabilities_by_category[0]
+        log_of_product_spam = 0;
+        
+        for w in p_d:
+            if w in x:
+                log_of_product_spam += (x[w] * math.log10(p_d[w]))
+            
+        p_y1 = log_of_product_spam + log_multinomial_coef + math.log10(prior_by_category[0])
+        
+        ### Posterior of being spam: log[ p(y=0|x) ]= log[ p(x|y=0)*p(y=0) ]  
+        q_d = probabilities_by_category[1]  
+        log_of_product_ham = 0;
+        
+        for w in q_d:
+            if w in x:
+                log_of_product_ham += (x[w] * math.log10(q_d[w]))
+            
+        p_y0 = log_of_product_ham + log_multinomial_coef + math.log10(prior_by_category[1])
+
+    with instrument.stage('threshold'):
+        if(p_y1 >= zeta*p_y0):
+            classify_result = ("spam", [p_y1, p_y0])
+        else:
+            classify_result = ("ham", [p_y1, p_y0])
     
-    denominator = 1
-    for w in x:
-        denominator = denominator*math.factorial(x[w])  
+    return classify_result
+
+
+def classify_email(filename, nb_model, zeta, multinomial_coef='lgamma'):
+    """
+    Same as classify_new_email, but scores the email with the precomputed log
+    tables of a model.NaiveBayesModel, so only additions are needed per word
+
+    Inputs
+    ------
+    filename: name of the file to be classified
+    nb_model: output of function learn_model
+    zeta: decision threshold, see classify_new_email
+    multinomial_coef: how to compute the multinomial coefficient, one of
+    'lgamma', 'exact' or 'drop', see get_log_multinomial_coef. Use 'exact' for
+    the exact log posterior
+
+    Output
+    ------
+    classify_result: same as classify_new_email, labelled with the names in
+    nb_model.categories: the first category if p(y=1|x) >= zeta*p(y=0|x) in
+    log space, else the second. Raises ValueError unless the model has
+    exactly two categories
+    """
+    if len(nb_model.categories) != 2:
+        raise ValueError("The zeta rule needs a model of two categories, use "
+                         "classify_batch_multiclass for %d" % len(nb_model.categories))
+    positive, negative = nb_model.categories
+    x = next(vectorizer.get_word_counts([filename]))
+    with instrument.stage('score'):
+        log_multinomial_coef = get_log_multinomial_coef(x, multinomial_coef)
+        p_y1, p_y0 = [s + log_multinomial_coef for s in model.score_word_counts(nb_model, x)]
     
-    log_multinomial_coef = math.log10(numerator) - math.log10(denominator)
+    with instrument.stage('threshold'):
+        if(p_y1 >= zeta*p_y0):
+            classify_result = (positive, [p_y1, p_y0])
+        else:
+            classify_result = (negative, [p_y1, p_y0])
     
-    ### Posterior of being spam: log[ p(y=1|x) ]= log[ p(x|y=1)*p(y=1) ]
-    p_d = probabilities_by_category[0]
-    log_of_product_spam = 0;
+    return classify_result
+
+
+def get_log_posteriors(file_list, nb_model, multinomial_coef='lgamma'):
+    """
+    Returns an N x K array whose [i, k] entry is log[ p(y=k|x) ] (up to the
+    evidence, like classify_new_email) for the i-th file of file_list, for a
+    model of any number of categories K. The batch is scored with one
+    sparse-dense matrix product.
+    """
+    ### Construct the feature vectors of the batch as a sparse count matrix,
+    ### ignoring words which are not in the vocabulary, and compute the
+    ### multinomial coefficient of every email on the way
+    log_multinomial_coefs = array('d')
+    word_counts = record_log_multinomial_coefs(vectorizer.get_word_counts(file_list), multinomial_coef,
+                                               log_multinomial_coefs)
+    count_matrix = vectorizer.get_count_matrix(word_counts, nb_model.vocabulary, grow=False)
+    with instrument.stage('score'):
+        log_multinomial_coefs = np.frombuffer(log_multinomial_coefs, dtype=np.float64)
+        return model.score_count_matrix(nb_model, count_matrix) + log_multinomial_coefs[:, np.newaxis]
+
+
+def classify_batch(file_list, nb_model, zeta, multinomial_coef='lgamma'):
+    """
+    Use Naive Bayes classification to classify all the emails in file_list at
+    once. Gives the same results as calling classify_new_email on every file
+    (up to floating point summation order), but scores the whole batch with one
+    sparse-dense matrix product instead of looping over the vocabulary.
+
+    Inputs
+    ------
+    file_list: list of names of the files to be classified
+    nb_model: output of function learn_model
+    zeta: decision threshold, see classify_new_email
+    multinomial_coef: how to compute the multinomial coefficient, one of
+    'lgamma', 'exact' or 'drop', see get_log_multinomial_coef
+
+    Output
+    ------
+    classify_results: A list with one classify_result per file, in the format
+    returned by classify_email
+    """
+    if len(nb_model.categories) != 2:
+        raise ValueError("The zeta rule needs a model of two categories, use "
+                         "classify_batch_multiclass for %d" % len(nb_model.categories))
+    positive, negative = nb_model.categories
     
-    for w in p_d:
-        if w in x:
-            log_of_product_spam += (x[w] * math.log10(p_d[w]))
-        
-    p_y1 = log_of_product_spam + log_multinomial_coef + math.log10(prior_by_category[0])
+    ### Column 0 is log[ p(y=1|x) ] and column 1 is log[ p(y=0|x) ] for every email
+    log_posteriors = get_log_posteriors(file_list, nb_model, multinomial_coef)
     
-    ### Posterior of being spam: log[ p(y=0|x) ]= log[ p(x|y=0)*p(y=0) ]  
-    q_d = probabilities_by_category[1]  
-    log_of_product_ham = 0;
+    with instrument.stage('threshold'):
+        classify_results = []
+        for p_y1, p_y0 in log_posteriors.tolist():
+            if(p_y1 >= zeta*p_y0):
+                classify_results.append((positive, [p_y1, p_y0]))
+            else:
+                classify_results.append((negative, [p_y1, p_y0]))
     
-    for w in q_d:
-        if w in x:
-            log_of_product_ham += (x[w] * math.log10(q_d[w]))
-        
-    p_y0 = log_of_product_ham + log_multinomial_coef + math.log10(prior_by_category[1])
+    return classify_results
 
-    if(p_y1 >= zeta*p_y0):
-        classify_result = ("spam", [p_y1, p_y0])
-    else:
-        classify_result = ("ham", [p_y1, p_y0])
-    
-    return classify_result
 
+def classify_batch_multiclass(file_list, nb_model, multinomial_coef='lgamma'):
+    """
+    Classify all the emails in file_list into the category of nb_model with
+    the highest posterior, for any number of categories K
+
+    Inputs
+    ------
+    file_list: list of names of the files to be classified
+    nb_model: output of function learn_model
+    multinomial_coef: see classify_batch. The coefficient is the same for 
+    every category, so 'drop' gives the same categories faster
+
+    Output
+    ------
+    classify_results: A list with one two-element tuple per file. The first
+    element is the name of the chosen category, and the second element is the
+    list of the K log posteriors [log p(y=0|x), ..., log p(y=K-1|x)], in the
+    order of nb_model.categories
+    """
+    log_posteriors = get_log_posteriors(file_list, nb_model, multinomial_coef)
+    best = np.argmax(log_posteriors, axis=1)
+    return [(nb_model.categories[k], log_posterior)
+            for k, log_posterior in zip(best.tolist(), log_posteriors.tolist())]
 
 if __name__ == '__main__':
+    # evaluation imports this module, so import it only when run as a script
+    import evaluation
     
     # folder for training and testing 
     spam_folder = "data/spam"
@@ -158,14 +431,13 @@ if __name__ == '__main__':
     for folder in (spam_folder, ham_folder):
         file_lists.append(util.get_files_in_folder(folder))
         
-    # Learn the distributions    
-    probabilities_by_category = learn_distributions(file_lists)
-    
     # prior class distribution
     priors_by_category = [0.5, 0.5]
     
+    # Learn the distributions    
+    nb_model = learn_model(file_lists, priors_by_category)
+    
     # Store the classification results
-    performance_measures = np.zeros([2,2])
     # explanation of performance_measures:
     # columns and rows are indexed by 0 = 'spam' and 1 = 'ham'
     # rows correspond to true label, columns correspond to guessed label
@@ -176,19 +448,11 @@ if __name__ == '__main__':
     # p3 = Number of emails whose true label is 'ham' and classified as 'spam' 
     # p4 = Number of emails whose true label is 'ham' and classified as 'ham' 
 
-    # Classify emails from testing set and measure the performance
+    # Classify emails from testing set once and measure the performance
+    # (the filename indicates the true label)
     print("Classifying...")
-    for filename in (util.get_files_in_folder(test_folder)):
-        # Classify
-        label,log_posterior = classify_new_email(filename,
-                                                 probabilities_by_category,
-                                                 priors_by_category, 1)
-        
-        # Measure performance (the filename indicates the true label)
-        base = os.path.basename(filename)
-        true_index = ('ham' in base) 
-        guessed_index = (label == 'ham')
-        performance_measures[int(true_index), int(guessed_index)] += 1
+    log_posteriors, true_labels = evaluation.score_files(util.get_files_in_folder(test_folder), nb_model)
+    performance_measures = evaluation.get_performance_measures(log_posteriors, true_labels, 1)
 
     template="You correctly classified %d out of %d spam emails, and %d out of %d ham emails."
     # Correct counts are on the diagonal
@@ -198,29 +462,15 @@ if __name__ == '__main__':
     print(template % (correct[0],totals[0],correct[1],totals[1]))
     
     
-    ### TODO: Write your code here to modify the decision rule such that
-    ### Type 1 and Type 2 errors can be traded off, plot the trade-off curve
+    ### Modify the decision rule such that Type 1 and Type 2 errors can be 
+    ### traded off, plot the trade-off curve from the cached scores
     plt.figure(1)
     
     zeta = np.arange(0.6, 1.25, 0.05)
-    for i in range(0, len(zeta)):
-        performance_measures = np.zeros([2,2])
-        for filename in (util.get_files_in_folder(test_folder)):
-            # Classify
-            label,log_posterior = classify_new_email(filename,
-                                                 probabilities_by_category,
-                                                 priors_by_category, zeta[i])
-        
-            # Measure performance (the filename indicates the true label)
-            base = os.path.basename(filename)
-            true_index = ('ham' in base) 
-            guessed_index = (label == 'ham')
-            performance_measures[int(true_index), int(guessed_index)] += 1
-        plt.scatter(performance_measures[0][1], performance_measures[1][0], color='blue')
+    type1, type2 = evaluation.sweep_thresholds(log_posteriors, true_labels, zeta)
+    evaluation.plot_tradeoff(type1, type2, "nbc.pdf")
     
-    plt.xlabel('Type 1 Errors')
-    plt.ylabel('Type 2 Errors')
+    zetas, type1, type2, auc = evaluation.tradeoff_curve(log_posteriors, true_labels)
+    print("Area under the ROC curve: %f" % auc)
     
-    plt.savefig("nbc.pdf")
     plt.show()
- 
\ No newline at end of file
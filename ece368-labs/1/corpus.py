@@ -0,0 +1,81 @@
+from collections import namedtuple
+import mmap
+import os
+import sys
+import numpy as np
+
+class PackedDocument(namedtuple('PackedDocument', ['name', 'data'])):
+    """
+    One email of a PackedCorpus: name is the file name it was packed from
+    and data is a zero-copy memoryview of its bytes in the corpus file.
+    Pickling copies the bytes, so documents can be sent to worker processes.
+    """
+    __slots__ = ()
+
+    def __reduce__(self):
+        return (PackedDocument, (self.name, bytes(self.data)))
+
+def get_index_filename(filename):
+    """ Returns the name of the offset index that belongs to the packed corpus filename """
+    return filename + '.idx'
+
+def is_packed_corpus(path):
+    """ Returns true if path is a packed corpus written by pack_corpus """
+    return os.path.isfile(path) and os.path.isfile(get_index_filename(path))
+
+def pack_corpus(file_list, filename):
+    """
+    Concatenate the files in file_list into the single data file filename,
+    and write the offset of every file and its name to the index file
+    get_index_filename(filename)
+    """
+    offsets = [0]
+    with open(filename, 'wb') as out:
+        for f in file_list:
+            with open(f, 'rb') as email:
+                offsets.append(offsets[-1] + out.write(email.read()))
+
+    with open(get_index_filename(filename), 'wb') as index:
+        np.savez(index, offsets=np.array(offsets, dtype=np.uint64),
+                 names=np.array([os.path.basename(f) for f in file_list], dtype=str))
+
+def pack_folder(folder, filename):
+    """ Pack every file in folder into the corpus filename, see pack_corpus """
+    file_list = [os.path.join(folder, name) for name in os.listdir(folder)]
+    pack_corpus(file_list, filename)
+
+class PackedCorpus(object):
+    """
+    A read-only sequence of PackedDocuments, backed by a memory map of a
+    corpus file written by pack_corpus
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        with np.load(get_index_filename(filename)) as index:
+            self.offsets = index['offsets'].tolist()
+            self.names = index['names'].tolist()
+        with open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size > 0:
+                self.data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            else:
+                # an empty file cannot be memory-mapped
+                self.data = memoryview(b'')
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return PackedDocument(self.names[i], self.data[self.offsets[i]:self.offsets[i + 1]])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+if __name__ == '__main__':
+    # usage: python corpus.py folder corpus_file
+    pack_folder(sys.argv[1], sys.argv[2])
@@ -0,0 +1,116 @@
+import sys
+import numpy as np
+import util
+import vectorizer
+import classifier
+import evaluation
+
+def get_folds(labels, num_folds, seed=0):
+    """
+    Returns an array with the fold (0 to num_folds-1) of every document.
+    The documents of each category are shuffled and dealt round-robin, so
+    every fold has about the same share of each category.
+    """
+    rng = np.random.RandomState(seed)
+    folds = np.zeros(len(labels), dtype=np.int64)
+    for category in np.unique(labels):
+        members = rng.permutation(np.flatnonzero(labels == category))
+        folds[members] = np.arange(len(members)) % num_folds
+    return folds
+
+def get_fold_class_counts(count_matrix, labels, folds, num_categories, num_folds):
+    """
+    Returns a num_folds x num_categories x len(vocabulary) array of the word
+    counts of every category within every fold, from one matrix reduction
+    """
+    fold_labels = folds*num_categories + labels
+    fold_class_counts = vectorizer.get_class_counts(count_matrix, fold_labels, num_folds*num_categories)
+    return fold_class_counts.reshape(num_folds, num_categories, -1)
+
+def cross_validate_counts(count_matrix, labels, num_categories, num_folds=5, alphas=(1.0,),
+                          prior_by_category=(0.5, 0.5), seed=0):
+    """
+    K-fold cross-validation of the Naive Bayes model over a grid of smoothing
+    constants, from a document-term matrix that was counted once
+
+    The word counts of the model that holds out fold f are the global counts
+    minus the counts of fold f, so no fold is recounted. Words which only
+    occur in fold f get no count and, as in a model trained on the other
+    folds only, are ignored (see classifier.smooth_class_counts). The held-out
+    documents of a fold are scored under every alpha with one sparse matrix
+    product.
+
+    Input
+    -----
+    count_matrix, labels: output of vectorizer.get_count_matrix_by_category
+    num_categories: number of categories K
+    num_folds: number of folds
+    alphas: smoothing constants to evaluate, alpha = 1 is Laplace smoothing
+    prior_by_category: prior of every category
+    seed: seed of the random fold assignment
+
+    Output
+    ------
+    log_posteriors: A len(alphas) x N x K array. [a, i, k] is the log
+    posterior of category k for document i under smoothing alphas[a], from
+    the model that did not see document i
+    """
+    alphas = np.asarray(alphas, dtype=np.float64)
+    folds = get_folds(labels, num_folds, seed)
+    class_counts = vectorizer.get_class_counts(count_matrix, labels, num_categories)
+    fold_class_counts = get_fold_class_counts(count_matrix, labels, folds, num_categories, num_folds)
+    log_multinomial_coefs = classifier.get_log_multinomial_coefs_from_matrix(count_matrix)
+    log_prior = np.log10(np.asarray(prior_by_category, dtype=np.float64))
+
+    log_posteriors = np.zeros((len(alphas), count_matrix.shape[0], num_categories))
+    for f in range(num_folds):
+        training_counts = class_counts - fold_class_counts[f]
+        # stack the log likelihoods of every alpha into one (A*K) x |V| matrix
+        log_likelihoods = np.concatenate([np.log10(classifier.smooth_class_counts(training_counts, alpha))
+                                          for alpha in alphas])
+        held_out = np.flatnonzero(folds == f)
+        scores = count_matrix[held_out] @ log_likelihoods.T
+        scores = scores.reshape(len(held_out), len(alphas), num_categories).transpose(1, 0, 2)
+        log_posteriors[:, held_out] = scores + log_multinomial_coefs[held_out, np.newaxis] + log_prior
+    return log_posteriors
+
+def cross_validate(file_lists_by_category, num_folds=5, alphas=(1.0,), zetas=(1.0,),
+                   prior_by_category=(0.5, 0.5), seed=0):
+    """
+    Count every file once, cross-validate over the grid of smoothing
+    constants alphas (see cross_validate_counts) and count the errors of
+    every threshold in zetas (see evaluation.sweep_thresholds)
+
+    Output
+    ------
+    A tuple of two len(alphas) x len(zetas) arrays: (type1, type2), the
+    number of spam emails classified as ham and of ham emails classified as
+    spam, summed over the folds
+    """
+    vocabulary, count_matrix, labels = vectorizer.get_count_matrix_by_category(file_lists_by_category)
+    log_posteriors = cross_validate_counts(count_matrix, labels, len(file_lists_by_category), num_folds,
+                                           alphas, prior_by_category, seed)
+    type1 = np.zeros((len(alphas), len(zetas)), dtype=np.int64)
+    type2 = np.zeros((len(alphas), len(zetas)), dtype=np.int64)
+    for a in range(len(alphas)):
+        type1[a], type2[a] = evaluation.sweep_thresholds(log_posteriors[a], labels, zetas)
+    return (type1, type2)
+
+
+if __name__ == '__main__':
+    # usage: python crossval.py [num_folds]
+    num_folds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    file_lists = [util.get_files_in_folder("data/spam"), util.get_files_in_folder("data/ham")]
+    num_files = sum(len(file_list) for file_list in file_lists)
+
+    alphas = np.array([0.01, 0.03, 0.1, 0.3, 1.0, 3.0])
+    zetas = np.arange(0.6, 1.25, 0.05)
+    type1, type2 = cross_validate(file_lists, num_folds, alphas, zetas)
+    error_rates = (type1 + type2)/num_files
+
+    print("Cross-validated error rate (rows: alpha, columns: zeta)")
+    print("alpha " + " ".join("%6.2f" % zeta for zeta in zetas))
+    for a, alpha in enumerate(alphas):
+        print("%5.2f " % alpha + " ".join("%6.4f" % e for e in error_rates[a]))
+    a, z = np.unravel_index(np.argmin(error_rates), error_rates.shape)
+    print("Best: alpha = %.2f, zeta = %.2f, error rate %.4f" % (alphas[a], zetas[z], error_rates[a, z]))
@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+from collections import deque
+import json
+import struct
+import time
+import numpy as np
+import util
+import corpus
+import classifier
+import model
+import cache
+
+# every request is a 4 byte big-endian length followed by the raw email; an
+# empty email asks for the latency statistics instead
+LENGTH = struct.Struct('>I')
+# default limit on the size of one email
+MAX_BYTES = 10*2**20
+
+class ScoringServer(object):
+    """
+    Classifies raw emails sent over a socket with a trained model.
+
+    Requests that arrive together are collected into micro-batches of at
+    most max_batch emails, waiting at most max_delay seconds for a batch to
+    fill, and every batch is scored with one classifier.classify_batch call.
+    The answer to a request is one JSON line,
+    {"label": "spam", "log_posterior": [log p(y=1|x), log p(y=0|x)]}
+    If result_cache (a cache.ResultCache) is given, repeated emails are
+    answered from it. A client that announces an email of more than
+    max_bytes bytes is disconnected without reading it.
+    """
+    def __init__(self, nb_model, zeta=1, max_batch=64, max_delay=0.002, multinomial_coef='lgamma', result_cache=None,
+                 max_bytes=MAX_BYTES):
+        self.nb_model = nb_model
+        self.max_bytes = max_bytes
+        self.result_cache = result_cache
+        self.zeta = zeta
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.multinomial_coef = multinomial_coef
+        self.queue = None
+        # latencies in seconds of the most recent requests
+        self.latencies = deque(maxlen=100000)
+        self.num_requests = 0
+        self.num_batches = 0
+        self.num_rejected = 0
+
+    def get_stats(self):
+        """ Returns a dict with the request and batch counts and the p50/p99 latency in ms """
+        stats = {'requests': self.num_requests, 'batches': self.num_batches, 'rejected': self.num_rejected}
+        if self.latencies:
+            p50, p99 = np.percentile(np.array(self.latencies), [50, 99])
+            stats.update({'p50_ms': 1000*p50, 'p99_ms': 1000*p99})
+        if self.result_cache is not None:
+            stats['cache'] = self.result_cache.get_stats()
+        return stats
+
+    def classify(self, bodies):
+        """ Score a batch of raw emails, returns their classify_results """
+        documents = [corpus.PackedDocument('request', body) for body in bodies]
+        if self.result_cache is not None:
+            return cache.classify_cached(documents, self.nb_model, self.result_cache, self.zeta,
+                                         self.multinomial_coef)
+        return classifier.classify_batch(documents, self.nb_model, self.zeta, self.multinomial_coef)
+
+    async def run_batches(self):
+        """ Collect queued requests into batches and score them until cancelled """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            bodies = [body for body, arrival, future in batch]
+            try:
+                classify_results = await loop.run_in_executor(None, self.classify, bodies)
+            except Exception as error:
+                for body, arrival, future in batch:
+                    future.set_exception(error)
+                continue
+            self.num_batches += 1
+            now = time.perf_counter()
+            for (body, arrival, future), classify_result in zip(batch, classify_results):
+                self.latencies.append(now - arrival)
+                future.set_result(classify_result)
+
+    async def handle_connection(self, reader, writer):
+        """ Answer the requests of one client, in order """
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(LENGTH.size)
+                    length = LENGTH.unpack(header)[0]
+                    if length > self.max_bytes:
+                        self.num_rejected += 1
+                        break
+                    body = await reader.readexactly(length)
+                except asyncio.IncompleteReadError:
+                    break
+                if not body:
+                    response = self.get_stats()
+                else:
+                    future = loop.create_future()
+                    await self.queue.put((body, time.perf_counter(), future))
+                    label, log_posterior = await future
+                    self.num_requests += 1
+                    response = {'label': label, 'log_posterior': log_posterior}
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8368, unix_path=None):
+        """ Serve on a Unix socket if unix_path is given, else on TCP host:port, until cancelled """
+        self.queue = asyncio.Queue()
+        batcher = asyncio.ensure_future(self.run_batches())
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, path=unix_path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+async def open_connection(host='127.0.0.1', port=8368, unix_path=None):
+    if unix_path is not None:
+        return await asyncio.open_unix_connection(unix_path)
+    return await asyncio.open_connection(host, port)
+
+async def request(reader, writer, body):
+    """ Send one raw email (or b'' for the statistics) and return the decoded answer """
+    writer.write(LENGTH.pack(len(body)) + body)
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+async def generate_load(bodies, num_requests, concurrency=32, host='127.0.0.1', port=8368, unix_path=None):
+    """
+    Load generator: concurrency clients send num_requests emails in total,
+    cycling through bodies, each waiting for its answer before sending the
+    next. Returns a dict with the throughput and client-side p50/p99 latency
+    in ms, and the statistics reported by the server.
+    """
+    latencies = []
+    counter = iter(range(num_requests))
+
+    async def client():
+        reader, writer = await open_connection(host, port, unix_path)
+        for i in counter:
+            start = time.perf_counter()
+            await request(reader, writer, bodies[i % len(bodies)])
+            latencies.append(time.perf_counter() - start)
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for i in range(concurrency)])
+    seconds = time.perf_counter() - start
+
+    reader, writer = await open_connection(host, port, unix_path)
+    server_stats = await request(reader, writer, b'')
+    writer.close()
+    p50, p99 = np.percentile(latencies, [50, 99])
+    return {'requests_per_second': num_requests/seconds, 'p50_ms': 1000*p50, 'p99_ms': 1000*p99,
+            'server': server_stats}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Naive Bayes spam scoring daemon")
+    parser.add_argument('command', choices=['serve', 'load'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8368)
+    parser.add_argument('--unix', help="path of a Unix socket to use instead of TCP")
+    parser.add_argument('--model', help="model file written by model.save_model (serve); "
+                                        "trains on data/spam and data/ham if not given")
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-delay', type=float, default=0.002, help="seconds to wait for a batch to fill")
+    parser.add_argument('--max-bytes', type=int, default=MAX_BYTES,
+                        help="largest email accepted; clients sending a larger one are disconnected")
+    parser.add_argument('--cache-size', type=int, default=0, help="number of results to cache, 0 for no cache")
+    parser.add_argument('--cache-file', help="file the result cache is loaded from and saved to")
+    parser.add_argument('--folder', default="data/testing", help="emails to send (load)")
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        if args.model is not None:
+            nb_model = model.load_model(args.model)
+        else:
+            file_lists = [util.get_files_in_folder("data/spam"), util.get_files_in_folder("data/ham")]
+            nb_model = classifier.learn_model(file_lists, [0.5, 0.5])
+        result_cache = None
+        if args.cache_size > 0:
+            result_cache = cache.ResultCache(args.cache_size, args.cache_file)
+        server = ScoringServer(nb_model, max_batch=args.max_batch, max_delay=args.max_delay,
+                               result_cache=result_cache, max_bytes=args.max_bytes)
+        print("Serving...")
+        try:
+            asyncio.run(server.serve(args.host, args.port, args.unix))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if result_cache is not None and args.cache_file is not None:
+                result_cache.save()
+    else:
+        bodies = [util.get_bytes_in_file(f) for f in util.get_files_in_folder(args.folder)]
+        result = asyncio.run(generate_load(bodies, args.requests, args.concurrency,
+                                           args.host, args.port, args.unix))
+        print(json.dumps(result, indent=2))
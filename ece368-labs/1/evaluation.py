@@ -0,0 +1,189 @@
+import os.path
+import numpy as np
+import matplotlib.pyplot as plt
+import util
+import classifier
+import model
+import instrument
+
+EVALUATION_CATEGORIES = ('spam', 'ham')
+
+def get_true_labels(file_list, categories=EVALUATION_CATEGORIES):
+    """
+    Returns an array with the true category index of every file in
+    categories, a permutation of ('spam', 'ham') such as nb_model.categories;
+    with the default 0 = 'spam' and 1 = 'ham' (the filename indicates the
+    true label)
+    """
+    check_categories(categories)
+    ham = categories.index('ham')
+    return np.array([ham if 'ham' in os.path.basename(util.get_document_name(f)) else 1 - ham
+                     for f in file_list], dtype=np.int64)
+
+def check_categories(categories):
+    """ Raise ValueError unless categories are 'spam' and 'ham', in any order """
+    if sorted(categories) != sorted(EVALUATION_CATEGORIES):
+        raise ValueError("The evaluation needs a model of the categories 'spam' and 'ham', not %s"
+                         % (tuple(categories),))
+
+def score_files(file_list, nb_model, cache_file=None, multinomial_coef='lgamma'):
+    """
+    Compute the log posterior pair of every file once
+
+    Input
+    -----
+    file_list: list of names of the files to be scored
+    nb_model: output of classifier.learn_model
+    cache_file: optional .npz file. If it holds the scores of the same files
+    under the same model they are loaded from it, otherwise they are computed
+    and saved to it
+    multinomial_coef: see classifier.get_log_multinomial_coef
+
+    Output
+    ------
+    A tuple of two elements: (log_posteriors, true_labels), in which
+    log_posteriors is an N x 2 array of [log p(spam|x), log p(ham|x)] rows,
+    whatever the order of nb_model.categories, and true_labels is the output
+    of get_true_labels with the default categories
+    """
+    check_categories(nb_model.categories)
+    version = model.get_model_version(nb_model) + multinomial_coef
+    names = [util.get_document_name(f) for f in file_list]
+    if cache_file is not None and os.path.exists(cache_file):
+        cached = np.load(cache_file)
+        if str(cached['version']) == version and cached['files'].tolist() == names:
+            return (cached['log_posteriors'], cached['true_labels'])
+
+    classify_results = classifier.classify_batch(file_list, nb_model, 1, multinomial_coef)
+    log_posteriors = np.array([log_posterior for label, log_posterior in classify_results],
+                              dtype=np.float64).reshape(len(file_list), 2)
+    # put the spam column first for count_classified_as_spam
+    log_posteriors = log_posteriors[:, [nb_model.categories.index(c) for c in EVALUATION_CATEGORIES]]
+    true_labels = get_true_labels(file_list)
+
+    if cache_file is not None:
+        with open(cache_file, 'wb') as f:
+            np.savez(f, version=version, files=np.array(names, dtype=str),
+                     log_posteriors=log_posteriors, true_labels=true_labels)
+    return (log_posteriors, true_labels)
+
+def get_posterior_ratios(log_posteriors):
+    """
+    Returns log p(y=1|x) / log p(y=0|x) for every row of log_posteriors with
+    log p(y=0|x) != 0, and nan for the others
+    """
+    p_y0 = log_posteriors[:, 1]
+    ratios = np.full(len(log_posteriors), np.nan)
+    nonzero = p_y0 != 0
+    ratios[nonzero] = log_posteriors[nonzero, 0]/p_y0[nonzero]
+    return ratios
+
+def count_classified_as_spam(log_posteriors, zetas):
+    """
+    Returns, for every zeta in zetas, the number of rows of log_posteriors for
+    which log p(y=1|x) >= zeta * log p(y=0|x), the spam rule of 
+    classify_new_email.
+    Dividing by log p(y=0|x) turns the rule into ratio <= zeta when 
+    log p(y=0|x) < 0 and ratio >= zeta when log p(y=0|x) > 0, so after sorting
+    the ratios once every zeta costs a binary search.
+    """
+    with instrument.stage('threshold'):
+        p_y1 = log_posteriors[:, 0]
+        p_y0 = log_posteriors[:, 1]
+        ratios = get_posterior_ratios(log_posteriors)
+        zetas = np.asarray(zetas, dtype=np.float64)
+        
+        negative_ratios = np.sort(ratios[p_y0 < 0])
+        positive_ratios = np.sort(ratios[p_y0 > 0])
+        counts = np.searchsorted(negative_ratios, zetas, side='right')
+        counts += len(positive_ratios) - np.searchsorted(positive_ratios, zetas, side='left')
+        # with log p(y=0|x) = 0 the decision does not depend on zeta
+        counts += np.count_nonzero(p_y1[p_y0 == 0] >= 0)
+        return counts
+
+def sweep_thresholds(log_posteriors, true_labels, zetas):
+    """
+    Count the errors for every threshold in zetas at once
+
+    Input
+    -----
+    log_posteriors, true_labels: output of score_files
+    zetas: 1D array of thresholds, see classifier.classify_new_email
+
+    Output
+    ------
+    A tuple of two arrays, each as long as zetas: (type1, type2), in which
+    type1[i] is the number of spam emails classified as ham and type2[i] is
+    the number of ham emails classified as spam with threshold zetas[i]
+    """
+    is_spam = true_labels == 0
+    type1 = np.count_nonzero(is_spam) - count_classified_as_spam(log_posteriors[is_spam], zetas)
+    type2 = count_classified_as_spam(log_posteriors[~is_spam], zetas)
+    return (type1, type2)
+
+def get_performance_measures(log_posteriors, true_labels, zeta):
+    """
+    Returns the 2x2 performance_measures array of classifier.py for threshold
+    zeta: rows are the true label and columns the guessed label, 0 = 'spam'
+    and 1 = 'ham'
+    """
+    type1, type2 = sweep_thresholds(log_posteriors, true_labels, [zeta])
+    totals = np.bincount(true_labels, minlength=2)
+    return np.array([[totals[0] - type1[0], type1[0]],
+                     [type2[0], totals[1] - type2[0]]], dtype=np.float64)
+
+def get_confusion_matrix(log_posteriors, true_labels):
+    """
+    Returns the K x K confusion matrix of the N x K log_posteriors of a model
+    of K categories, choosing the category with the highest posterior: rows
+    are the true category index and columns the guessed one. For K = 2 it
+    equals get_performance_measures at zeta = 1, up to ties.
+    """
+    num_categories = log_posteriors.shape[1]
+    guessed_labels = np.argmax(log_posteriors, axis=1)
+    counts = np.bincount(true_labels*num_categories + guessed_labels, minlength=num_categories**2)
+    return counts.reshape(num_categories, num_categories).astype(np.float64)
+
+def tradeoff_curve(log_posteriors, true_labels):
+    """
+    Compute the complete Type 1 / Type 2 error trade-off curve and its AUC
+
+    Input
+    -----
+    log_posteriors, true_labels: output of score_files
+
+    Output
+    ------
+    A tuple of four elements: (zetas, type1, type2, auc). zetas holds every
+    threshold at which the errors can change, plus one below and one above
+    all of them, and type1/type2 are the output of sweep_thresholds for them.
+    auc is the area under the ROC curve (spam detection rate against ham false
+    alarm rate) traced by the sweep
+    """
+    ratios = get_posterior_ratios(log_posteriors)
+    zetas = np.unique(ratios[~np.isnan(ratios)])
+    if len(zetas) == 0:
+        zetas = np.array([1.0])
+    zetas = np.concatenate(([np.nextafter(zetas[0], -np.inf)], zetas,
+                            [np.nextafter(zetas[-1], np.inf)]))
+    type1, type2 = sweep_thresholds(log_posteriors, true_labels, zetas)
+
+    totals = np.bincount(true_labels, minlength=2)
+    true_positive_rate = np.concatenate(([0.0], 1 - type1/totals[0], [1.0]))
+    false_positive_rate = np.concatenate(([0.0], type2/totals[1], [1.0]))
+    order = np.lexsort((true_positive_rate, false_positive_rate))
+    true_positive_rate = true_positive_rate[order]
+    false_positive_rate = false_positive_rate[order]
+    auc = np.sum(np.diff(false_positive_rate)*(true_positive_rate[1:] + true_positive_rate[:-1])/2)
+    return (zetas, type1, type2, auc)
+
+def plot_tradeoff(type1, type2, filename=None, color='blue'):
+    """
+    Scatter plot of Type 1 against Type 2 errors in one call, saved to
+    filename if it is given
+    """
+    plt.scatter(type1, type2, color=color)
+    plt.xlabel('Type 1 Errors')
+    plt.ylabel('Type 2 Errors')
+    if filename is not None:
+        plt.savefig(filename)
@@ -0,0 +1,89 @@
+import numpy as np
+import util
+import vectorizer
+
+class InvertedIndex(object):
+    """
+    An inverted index over a list of files: for every word, the postings are
+    the ids of the files it occurs in (positions in the file list) and how
+    many times it occurs in each.
+
+    Postings are stored column by column in a CSC matrix, so the postings of
+    a word are one slice and document frequencies and word totals are
+    precomputed arrays.
+    """
+    def __init__(self, names, words, indptr, file_ids, counts):
+        self.names = names
+        # identifies names for util.check_index
+        self.fingerprint = util.get_names_fingerprint(names)
+        self.vocabulary = vectorizer.Vocabulary(words)
+        self.indptr = indptr
+        self.file_ids = file_ids
+        self.counts = counts
+        self.document_frequencies = np.diff(indptr)
+        # every word occurs in at least one file, so no postings are empty
+        self.word_totals = np.add.reduceat(counts, indptr[:-1]) if len(counts) else np.zeros(0, dtype=np.int64)
+        self.total_word_count = int(counts.sum())
+
+    def __len__(self):
+        return len(self.vocabulary)
+
+    def __contains__(self, word):
+        return word in self.vocabulary
+
+    def postings(self, word):
+        """ Returns a tuple (file_ids, counts) of the files word occurs in """
+        word_id = self.vocabulary.get(word)
+        if word_id is None:
+            return (self.file_ids[:0], self.counts[:0])
+        start, end = self.indptr[word_id], self.indptr[word_id + 1]
+        return (self.file_ids[start:end], self.counts[start:end])
+
+    def word_count(self, word):
+        """ Returns how many times word occurs in all the files """
+        word_id = self.vocabulary.get(word)
+        return 0 if word_id is None else int(self.word_totals[word_id])
+
+    def document_frequency(self, word):
+        """ Returns the number of files word occurs in """
+        word_id = self.vocabulary.get(word)
+        return 0 if word_id is None else int(self.document_frequencies[word_id])
+
+    def get_counts(self):
+        """ Same as util.get_counts over the indexed files """
+        return util.Counter(zip(self.vocabulary.words, self.document_frequencies.tolist()))
+
+    def get_word_freq(self):
+        """ Same as util.get_word_freq over the indexed files """
+        return util.Counter(zip(self.vocabulary.words, self.word_totals.tolist()))
+
+    def save(self, filename):
+        """ Save the index to filename, see load_index """
+        with open(filename, 'wb') as f:
+            np.savez(f, names=encode_lines(self.names), words=encode_lines(self.vocabulary.words),
+                     indptr=self.indptr, file_ids=self.file_ids, counts=self.counts)
+
+def encode_lines(strings):
+    """ Returns the strings joined by newlines as a uint8 array """
+    return np.frombuffer('\n'.join(strings).encode('utf-8'), dtype=np.uint8)
+
+def decode_lines(array):
+    """ Inverse of encode_lines """
+    if len(array) == 0:
+        return []
+    return array.tobytes().decode('utf-8').split('\n')
+
+def build_index(file_list):
+    """ Read every file in file_list once and return its InvertedIndex """
+    vocabulary = vectorizer.Vocabulary()
+    count_matrix = vectorizer.get_count_matrix(vectorizer.get_word_counts(file_list), vocabulary).tocsc()
+    count_matrix.sort_indices()
+    names = [util.get_document_name(f) for f in file_list]
+    return InvertedIndex(names, vocabulary.words, count_matrix.indptr.astype(np.int64),
+                         count_matrix.indices.astype(np.int64), count_matrix.data.astype(np.int64))
+
+def load_index(filename):
+    """ Load an InvertedIndex saved with InvertedIndex.save """
+    with np.load(filename) as data:
+        return InvertedIndex(decode_lines(data['names']), decode_lines(data['words']),
+                             data['indptr'], data['file_ids'], data['counts'])
@@ -0,0 +1,167 @@
+import cProfile
+import sys
+import time
+
+# Opt-in instrumentation of the stages of the classifier: 'read', 'tokenize',
+# 'count', 'smooth', 'score' and 'threshold'. The pipeline wraps every stage
+# in a `with instrument.stage(name) as s:` block; while instrumentation is
+# disabled, stage() returns one shared object whose methods do nothing, so the
+# cost is a global lookup and two empty method calls per block.
+# Not thread-safe: enable it only in single-threaded runs.
+
+_enabled = False
+# names of the stages being timed, outermost first
+_stack = []
+# tuple of stage names (a stack) -> [seconds, calls, bytes, seconds of nested stages]
+_stats = {}
+
+class _Stage(object):
+    """ Times one block of a stage and adds it to the statistics """
+    __slots__ = ('name', 'path', 'start', 'num_bytes')
+
+    def __init__(self, name):
+        self.name = name
+        self.num_bytes = 0
+
+    def __enter__(self):
+        _stack.append(self.name)
+        self.path = tuple(_stack)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        _stack.pop()
+        record = _stats.get(self.path)
+        if record is None:
+            record = _stats[self.path] = [0.0, 0, 0, 0.0]
+        record[0] += seconds
+        record[1] += 1
+        record[2] += self.num_bytes
+        parent = _stats.get(self.path[:-1])
+        if parent is not None:
+            parent[3] += seconds
+        elif len(self.path) > 1:
+            _stats[self.path[:-1]] = [0.0, 0, 0, seconds]
+        return False
+
+    def add_bytes(self, num_bytes):
+        """ Count num_bytes bytes processed by this block """
+        self.num_bytes += num_bytes
+
+class _DisabledStage(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def add_bytes(self, num_bytes):
+        pass
+
+_DISABLED_STAGE = _DisabledStage()
+
+def stage(name):
+    """ Returns a context manager that times a block of the stage name, if enabled """
+    if _enabled:
+        return _Stage(name)
+    return _DISABLED_STAGE
+
+def enable():
+    global _enabled
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    """ Forget all statistics collected so far """
+    del _stack[:]
+    _stats.clear()
+
+def get_stats():
+    """
+    Returns a dict whose keys are stage names and whose values are dicts with
+    the total wall time ('seconds'), the number of timed blocks ('calls') and
+    the number of bytes they processed ('bytes'). The time of a stage nested
+    in another one counts for both.
+    """
+    stats = {}
+    for path, (seconds, calls, num_bytes, nested_seconds) in _stats.items():
+        if not calls:
+            continue
+        name = path[-1]
+        if name in path[:-1]:
+            # already counted by the enclosing block of the same stage
+            seconds = 0.0
+        total = stats.setdefault(name, {'seconds': 0.0, 'calls': 0, 'bytes': 0})
+        total['seconds'] += seconds
+        total['calls'] += calls
+        total['bytes'] += num_bytes
+    return stats
+
+def print_stats(out=sys.stdout):
+    """ Print a table of get_stats(), slowest stage first """
+    stats = get_stats()
+    out.write("%-12s %10s %10s %12s %10s\n" % ('stage', 'seconds', 'calls', 'bytes', 'MB/s'))
+    for name in sorted(stats, key=lambda name: -stats[name]['seconds']):
+        s = stats[name]
+        throughput = s['bytes']/s['seconds']/2**20 if s['bytes'] and s['seconds'] else 0.0
+        out.write("%-12s %10.4f %10d %12d %10.1f\n" % (name, s['seconds'], s['calls'], s['bytes'], throughput))
+
+def write_collapsed_stacks(filename):
+    """
+    Write the statistics as collapsed stacks, one line 'outer;inner count'
+    per stack of stages, where count is the time spent in the innermost stage
+    itself, in microseconds. flamegraph.pl and speedscope read this format.
+    """
+    with open(filename, 'w') as f:
+        for path, (seconds, calls, num_bytes, nested_seconds) in sorted(_stats.items()):
+            self_microseconds = int(round(1e6*(seconds - nested_seconds)))
+            if self_microseconds > 0:
+                f.write("%s %d\n" % (';'.join(path), self_microseconds))
+
+def profile(function, filename):
+    """
+    Run function() under cProfile and dump the profile to filename, which
+    pstats.Stats (or snakeviz) can read. Returns the value of function().
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function)
+    finally:
+        profiler.dump_stats(filename)
+
+
+if __name__ == '__main__':
+    # usage: python instrument.py [profile.pstats] [stacks.txt]
+    # train on data/spam and data/ham and score data/testing with every stage
+    # timed, and optionally profile the run with cProfile as well. The
+    # pipeline imports this file as the module instrument, which is a
+    # different module from __main__, so it is used through that import.
+    import instrument
+    import util
+    import classifier
+
+    def run():
+        file_lists = [util.get_files_in_folder("data/spam"), util.get_files_in_folder("data/ham")]
+        with instrument.stage('train'):
+            nb_model = classifier.learn_model(file_lists, [0.5, 0.5])
+        with instrument.stage('classify'):
+            classifier.classify_batch(util.get_files_in_folder("data/testing"), nb_model, 1)
+
+    instrument.enable()
+    if len(sys.argv) > 1:
+        instrument.profile(run, sys.argv[1])
+    else:
+        run()
+    instrument.disable()
+    instrument.print_stats()
+    if len(sys.argv) > 2:
+        instrument.write_collapsed_stacks(sys.argv[2])
@@ -0,0 +1,235 @@
+from collections import namedtuple
+import hashlib
+import struct
+import numpy as np
+import vectorizer
+
+MODEL_MAGIC = b'NBMODEL1'
+# magic, then num_categories, num_words, itemsize of the log likelihoods and the
+# offsets of the log likelihoods, the word offsets, the word strings and the
+# category names
+MODEL_HEADER = struct.Struct('<8s7Q')
+
+class NaiveBayesModel(namedtuple('NaiveBayesModel',
+                                 ['categories', 'vocabulary', 'log_likelihoods', 'log_prior'])):
+    """
+    A trained multinomial Naive Bayes model, stored in log space.
+    All logs are base 10, like in classifier.classify_new_email.
+
+    categories: tuple of category names, e.g. ('spam', 'ham')
+    vocabulary: a vectorizer.Vocabulary mapping words to column ids
+    log_likelihoods: K x len(vocabulary) read-only array, row k is the log of
+    the smoothed word probabilities of category k (row 0 is log p_d, row 1 is
+    log q_d)
+    log_prior: read-only array of length K, the log prior of each category
+
+    The model is immutable, build it with make_model.
+    """
+    __slots__ = ()
+
+def make_model(vocabulary, probabilities, prior_by_category, categories=('spam', 'ham')):
+    """
+    Take the log of the smoothed word probabilities and of the prior once, and
+    freeze them in a NaiveBayesModel
+
+    Input
+    -----
+    vocabulary: a vectorizer.Vocabulary
+    probabilities: K x len(vocabulary) array of smoothed word probabilities, as
+    returned by classifier.learn_probability_vectors
+    prior_by_category: list of K prior probabilities, e.g. [\\pi, 1-\\pi]
+    categories: K category names
+
+    Output
+    ------
+    model: a NaiveBayesModel
+    """
+    log_likelihoods = np.log10(probabilities)
+    log_prior = np.log10(np.asarray(prior_by_category, dtype=np.float64))
+    log_likelihoods.setflags(write=False)
+    log_prior.setflags(write=False)
+    return NaiveBayesModel(tuple(categories), vocabulary, log_likelihoods, log_prior)
+
+def score_count_matrix(model, count_matrix):
+    """
+    Returns an N x K array of log[ p(x|y=k)*p(y=k) ] for the N documents in
+    count_matrix, leaving out the multinomial coefficient.
+    count_matrix must have been built against model.vocabulary.
+    """
+    return count_matrix @ model.log_likelihoods.T + model.log_prior
+
+def score_word_counts(model, x):
+    """
+    Returns a list of log[ p(x|y=k)*p(y=k) ] for every category k, leaving out
+    the multinomial coefficient. x is a dict whose keys are words and whose
+    values are word counts; words not in the vocabulary are ignored.
+    """
+    scores = model.log_prior.tolist()
+    columns = []
+    counts = []
+    for w in x:
+        word_id = model.vocabulary.get(w)
+        if word_id is not None:
+            columns.append(word_id)
+            counts.append(x[w])
+    if columns:
+        scores = (model.log_likelihoods[:, columns] @ np.array(counts, dtype=np.float64)
+                  + model.log_prior).tolist()
+    return scores
+
+def get_model_version(nb_model):
+    """
+    Returns a hex string fingerprint of the parameters of nb_model. Two models
+    have the same version exactly when they would score every email the same.
+    """
+    h = hashlib.sha1()
+    h.update(repr(nb_model.categories).encode('utf-8'))
+    if isinstance(nb_model.vocabulary, vectorizer.HashingVocabulary):
+        h.update(('hashing %d' % nb_model.vocabulary.num_bits).encode('utf-8'))
+    else:
+        h.update('\n'.join(nb_model.vocabulary).encode('utf-8', 'surrogatepass'))
+    h.update(np.ascontiguousarray(nb_model.log_likelihoods).tobytes())
+    h.update(np.ascontiguousarray(nb_model.log_prior).tobytes())
+    return h.hexdigest()
+
+
+class MappedVocabulary(object):
+    """
+    A read-only vocabulary backed by a sorted string table in a buffer (e.g. a
+    memory-mapped model file). Word ids are the positions of the words in
+    sorted (utf-8 byte) order, and lookups are binary searches, so no Python
+    dict has to be built when a model is loaded. The ids of the words that are
+    found are remembered in a per-process dict, which therefore never grows
+    beyond the vocabulary; words that are not in the vocabulary are searched
+    for every time, so unseen tokens cannot grow it.
+
+    word_offsets: read-only uint64 array of the |V|+1 offsets of the words in
+    strings, a view into the same buffer
+    """
+    def __init__(self, word_offsets, strings):
+        self.word_offsets = word_offsets
+        self.strings = strings
+        self.cache = dict()
+
+    def __len__(self):
+        return len(self.word_offsets) - 1
+
+    def get_word_bytes(self, word_id):
+        start, end = self.word_offsets[word_id:word_id + 2].tolist()
+        return bytes(self.strings[start:end])
+
+    def get(self, word, default=None):
+        """ Returns the id of word, or default if it is not in the vocabulary """
+        word_id = self.cache.get(word)
+        if word_id is None:
+            word_id = self.search(word)
+            if word_id is None:
+                return default
+            self.cache[word] = word_id
+        return word_id
+
+    def search(self, word):
+        """ Binary search for word in the string table, returns its id or None """
+        key = word.encode('utf-8')
+        low = 0
+        high = len(self)
+        while low < high:
+            middle = (low + high)//2
+            if self.get_word_bytes(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self) and self.get_word_bytes(low) == key:
+            return low
+        return None
+
+    def __getitem__(self, word):
+        word_id = self.get(word)
+        if word_id is None:
+            raise KeyError(word)
+        return word_id
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+    def __iter__(self):
+        for word_id in range(len(self)):
+            yield self.get_word_bytes(word_id).decode('utf-8')
+
+    @property
+    def words(self):
+        return list(self)
+
+def save_model(nb_model, filename, dtype=np.float64):
+    """
+    Save nb_model to filename in a compact binary format, which load_model can
+    memory-map
+
+    The file holds a header, the log prior (float64), the log likelihoods as
+    a K x |V| array of dtype (np.float64 or np.float32), then the vocabulary
+    as a string table: |V|+1 uint64 offsets into the utf-8 bytes of the words,
+    sorted, so that the columns of the log likelihoods follow the sorted order.
+    """
+    with open(filename, 'wb') as f:
+        f.write(serialize_model(nb_model, dtype))
+
+def serialize_model(nb_model, dtype=np.float64):
+    """ Returns the bytes written by save_model """
+    if isinstance(nb_model.vocabulary, vectorizer.HashingVocabulary):
+        raise ValueError("Models over a HashingVocabulary have no string table to save")
+    dtype = np.dtype(dtype).newbyteorder('<')
+    words = [w.encode('utf-8') for w in nb_model.vocabulary]
+    ids = np.array([nb_model.vocabulary[w] for w in nb_model.vocabulary], dtype=np.int64)
+    order = sorted(range(len(words)), key=words.__getitem__)
+    sorted_words = [words[i] for i in order]
+    log_likelihoods = np.ascontiguousarray(nb_model.log_likelihoods[:, ids[order]], dtype=dtype)
+    word_offsets = np.zeros(len(words) + 1, dtype='<u8')
+    np.cumsum([len(w) for w in sorted_words], out=word_offsets[1:])
+    categories = '\n'.join(nb_model.categories).encode('utf-8')
+
+    num_categories, num_words = log_likelihoods.shape
+    likelihoods_offset = MODEL_HEADER.size + 8*num_categories
+    word_offsets_offset = likelihoods_offset + log_likelihoods.nbytes
+    word_offsets_offset += -word_offsets_offset % 8
+    strings_offset = word_offsets_offset + word_offsets.nbytes
+    categories_offset = strings_offset + int(word_offsets[-1])
+
+    data = bytearray(categories_offset + len(categories))
+    MODEL_HEADER.pack_into(data, 0, MODEL_MAGIC, num_categories, num_words, dtype.itemsize,
+                           likelihoods_offset, word_offsets_offset, strings_offset, categories_offset)
+    data[MODEL_HEADER.size:likelihoods_offset] = np.asarray(nb_model.log_prior, dtype='<f8').tobytes()
+    data[likelihoods_offset:likelihoods_offset + log_likelihoods.nbytes] = log_likelihoods.tobytes()
+    data[word_offsets_offset:strings_offset] = word_offsets.tobytes()
+    data[strings_offset:categories_offset] = b''.join(sorted_words)
+    data[categories_offset:] = categories
+    return bytes(data)
+
+def load_model(filename):
+    """
+    Load a model saved by save_model. The file is memory-mapped with
+    numpy.memmap, so nothing is read until it is used, and processes which load
+    the same file share its pages. The returned model is read-only.
+    """
+    return load_model_from_buffer(np.memmap(filename, dtype=np.uint8, mode='r'))
+
+def load_model_from_buffer(buffer):
+    """
+    Returns a NaiveBayesModel whose arrays and vocabulary are views into
+    buffer, which holds the bytes written by save_model
+    """
+    magic, num_categories, num_words, itemsize, likelihoods_offset, word_offsets_offset, \
+        strings_offset, categories_offset = MODEL_HEADER.unpack_from(buffer, 0)
+    if magic != MODEL_MAGIC:
+        raise ValueError("Not a Naive Bayes model file")
+
+    buffer = memoryview(buffer).cast('B')
+    log_prior = np.frombuffer(buffer, dtype='<f8', count=num_categories, offset=MODEL_HEADER.size)
+    log_likelihoods = np.frombuffer(buffer, dtype='<f%d' % itemsize, count=num_categories*num_words,
+                                    offset=likelihoods_offset).reshape(num_categories, num_words)
+    word_offsets = np.frombuffer(buffer, dtype='<u8', count=num_words + 1, offset=word_offsets_offset)
+    vocabulary = MappedVocabulary(word_offsets, buffer[strings_offset:categories_offset])
+    categories = bytes(buffer[categories_offset:]).decode('utf-8').split('\n')
+    log_prior.setflags(write=False)
+    log_likelihoods.setflags(write=False)
+    word_offsets.setflags(write=False)
+    return NaiveBayesModel(tuple(categories), vocabulary, log_likelihoods, log_prior)
@@ -0,0 +1,137 @@
+import numbers
+import numpy as np
+import vectorizer
+import model
+
+class OnlineNaiveBayes(object):
+    """
+    A multinomial Naive Bayes model that can be updated with new labelled
+    emails, and have emails removed again, without retraining from scratch.
+
+    It keeps the raw per-category word counts and total word counts. The log
+    of the smoothed numerators, log(count + 1), is only recomputed for the
+    words touched since the last call to get_model; the normalizers
+    log(total count + |W|) are recomputed from the K totals. Training on a
+    set of files with partial_fit gives the same model as
+    classifier.learn_model on the same files, up to floating point rounding.
+    """
+    def __init__(self, categories=('spam', 'ham')):
+        self.categories = tuple(categories)
+        self.vocabulary = vectorizer.Vocabulary()
+        self.counts = np.zeros((len(self.categories), 1024), dtype=np.int64)
+        self.totals = np.zeros(len(self.categories), dtype=np.int64)
+        self.log_numerators = np.zeros(self.counts.shape)
+        self.dirty = set()
+        self.num_dead_words = 0
+        self.model = None
+        self.prior_by_category = None
+
+    def get_category_index(self, label):
+        """ label is either a category name or a category index """
+        if label in self.categories:
+            return self.categories.index(label)
+        if isinstance(label, numbers.Integral) and 0 <= label < len(self.categories):
+            return label
+        raise ValueError("Unknown category: %s" % (label,))
+
+    def get_file_counts(self, files, grow):
+        """
+        Returns a tuple (word_ids, counts, total): the ids of the words in the
+        files, how often each occurs, and the total number of words
+        """
+        word_counts = list(vectorizer.get_word_counts(files))
+        count_matrix = vectorizer.get_count_matrix(word_counts, self.vocabulary, grow)
+        total = sum(sum(x.values()) for x in word_counts)
+        if count_matrix.sum() != total:
+            raise ValueError("The files contain words that were never trained on")
+        counts = np.asarray(count_matrix.sum(axis=0)).ravel()
+        word_ids = np.flatnonzero(counts)
+        return (word_ids, counts[word_ids], total)
+
+    def partial_fit(self, files, label):
+        """ Add the words of every file in files to the counts of category label """
+        k = self.get_category_index(label)
+        num_old_words = len(self.vocabulary)
+        word_ids, counts, total = self.get_file_counts(files, grow=True)
+        if len(self.vocabulary) > self.counts.shape[1]:
+            capacity = max(len(self.vocabulary), 2*self.counts.shape[1])
+            self.counts = np.pad(self.counts, ((0, 0), (0, capacity - self.counts.shape[1])), 'constant')
+            self.log_numerators = np.pad(self.log_numerators,
+                                         ((0, 0), (0, capacity - self.log_numerators.shape[1])), 'constant')
+
+        # words which had been forgotten completely are part of W again
+        old_ids = word_ids[word_ids < num_old_words]
+        self.num_dead_words -= np.count_nonzero(self.counts[:, old_ids].sum(axis=0) == 0)
+        self.counts[k, word_ids] += counts
+        self.totals[k] += total
+        self.dirty.update(word_ids.tolist())
+        self.model = None
+
+    def forget(self, files, label):
+        """
+        Remove the words of every file in files from the counts of category
+        label. The files must have been added to label with partial_fit.
+        Words whose counts drop to zero in every category leave W.
+        """
+        k = self.get_category_index(label)
+        word_ids, counts, total = self.get_file_counts(files, grow=False)
+        if np.any(self.counts[k, word_ids] < counts) or self.totals[k] < total:
+            raise ValueError("The files were not all trained on as %s" % self.categories[k])
+
+        self.counts[k, word_ids] -= counts
+        self.totals[k] -= total
+        self.num_dead_words += np.count_nonzero(self.counts[:, word_ids].sum(axis=0) == 0)
+        self.dirty.update(word_ids.tolist())
+        self.model = None
+
+    def get_vocabulary_size(self):
+        """ Returns |W|, the number of words with a nonzero count """
+        return len(self.vocabulary) - self.num_dead_words
+
+    def get_log_normalizers(self):
+        """ Returns log(total count + |W|) for every category """
+        return np.log10(self.totals + self.get_vocabulary_size())
+
+    def log_probability(self, word, label):
+        """ Returns the log of the smoothed probability of word in category label """
+        k = self.get_category_index(label)
+        word_id = self.vocabulary.get(word)
+        count = 0 if word_id is None else self.counts[k, word_id]
+        return np.log10(count + 1) - self.get_log_normalizers()[k]
+
+    def compact(self):
+        """ Drop the words whose counts are zero in every category from the vocabulary """
+        num_words = len(self.vocabulary)
+        live = np.flatnonzero(self.counts[:, :num_words].sum(axis=0) > 0)
+        self.vocabulary = vectorizer.Vocabulary(self.vocabulary.words[i] for i in live)
+        self.counts = self.counts[:, live]
+        self.log_numerators = self.log_numerators[:, live]
+        self.dirty = set(np.flatnonzero(np.isin(live, list(self.dirty))).tolist())
+        self.num_dead_words = 0
+
+    def get_model(self, prior_by_category):
+        """
+        Returns a model.NaiveBayesModel of the current counts. The model is
+        cached until the next partial_fit or forget.
+        """
+        if self.model is not None and list(prior_by_category) == self.prior_by_category:
+            return self.model
+
+        if self.num_dead_words:
+            self.compact()
+        num_words = len(self.vocabulary)
+        if self.dirty:
+            dirty = np.fromiter(self.dirty, dtype=np.int64, count=len(self.dirty))
+            self.log_numerators[:, dirty] = np.log10(self.counts[:, dirty] + 1)
+            self.dirty = set()
+
+        log_likelihoods = self.log_numerators[:, :num_words] - self.get_log_normalizers()[:, np.newaxis]
+        log_prior = np.log10(np.asarray(prior_by_category, dtype=np.float64))
+        log_likelihoods.setflags(write=False)
+        log_prior.setflags(write=False)
+        # words are only appended to the vocabulary, and compact() replaces it,
+        # so a view of its current words is unaffected by later updates
+        self.model = model.NaiveBayesModel(self.categories, vectorizer.VocabularyPrefix(self.vocabulary),
+                                           log_likelihoods, log_prior)
+        self.prior_by_category = list(prior_by_category)
+        return self.model
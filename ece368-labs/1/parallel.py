@@ -0,0 +1,71 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import util
+import vectorizer
+
+def _count_shard(file_list):
+    """ Map step: the word counts (in order of first occurrence) of one shard """
+    vocabulary, word_counts_by_category, total_counts_by_category = util.count_words_by_category([file_list])
+    return word_counts_by_category[0]
+
+def get_shards(file_lists_by_category, shard_size):
+    """
+    Split every file list into consecutive shards of at most shard_size files.
+    Returns a tuple of two lists: (shards, shard_categories)
+    """
+    shards = []
+    shard_categories = []
+    for category, file_list in enumerate(file_lists_by_category):
+        for start in range(0, len(file_list), shard_size):
+            shards.append(file_list[start:start + shard_size])
+            shard_categories.append(category)
+    return (shards, shard_categories)
+
+def get_class_counts_parallel(file_lists_by_category, workers=None, shard_size=256, vocabulary=None):
+    """
+    Count the words of every category with a process pool
+
+    Input
+    -----
+    file_lists_by_category: A list with one list of files per category.
+    workers: number of worker processes, None for one per CPU
+    shard_size: number of files each worker tokenizes and counts at a time
+    vocabulary: An optional Vocabulary (or HashingVocabulary) to extend; a new
+    Vocabulary is created if None.
+
+    Output
+    ------
+    A tuple of two elements: (vocabulary, class_counts), the same as
+    vectorizer.get_count_matrix_by_category followed by
+    vectorizer.get_class_counts. Shards are merged in order, so word ids
+    (and therefore the estimated distributions) are identical to the serial ones
+    """
+    if vocabulary is None:
+        vocabulary = vectorizer.Vocabulary()
+    shards, shard_categories = get_shards(file_lists_by_category, shard_size)
+
+    ### Map: tokenize and count the shards in the worker processes
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        shard_counts = pool.map(_count_shard, shards)
+
+        if isinstance(vocabulary, vectorizer.HashingVocabulary):
+            ### Reduce: add every shard into the fixed size class counts as it arrives
+            class_counts = np.zeros((len(file_lists_by_category), len(vocabulary)), dtype=np.int64)
+            for category, shard in zip(shard_categories, shard_counts):
+                buckets = np.fromiter((vocabulary.get(w) for w in shard), dtype=np.int64, count=len(shard))
+                np.add.at(class_counts[category], buckets,
+                          np.fromiter(shard.values(), dtype=np.int64, count=len(shard)))
+            return (vocabulary, class_counts)
+
+        ### Reduce: merge the partial counters in shard order
+        rows = []
+        columns = []
+        counts = []
+        for category, shard in zip(shard_categories, shard_counts):
+            rows.extend([category] * len(shard))
+            columns.extend([vocabulary.add(w) for w in shard])
+            counts.extend(shard.values())
+
+    class_counts = np.zeros((len(file_lists_by_category), len(vocabulary)), dtype=np.int64)
+    np.add.at(class_counts, (rows, columns), counts)
+    return (vocabulary, class_counts)
@@ -0,0 +1,80 @@
+import argparse
+import contextlib
+import csv
+import json
+import sys
+import time
+import util
+import classifier
+import model
+import service
+
+def get_fields(nb_model):
+    """
+    Returns the names of the columns of the results of nb_model: file, label,
+    one log_posterior_<category> per category of the model, in the order of
+    nb_model.categories, and ms
+    """
+    return ['file', 'label'] + ['log_posterior_%s' % category for category in nb_model.categories] + ['ms']
+
+def score_folder(folder, nb_model, zeta=1, chunk_size=1024, multinomial_coef='lgamma'):
+    """
+    Classify every file in the tree below folder, chunk_size files at a time
+
+    The tree is walked lazily (see util.walk_files_in_folder) and only one
+    chunk of files is held at once, so memory does not grow with the number
+    of files.
+
+    Output
+    ------
+    A generator of one dict per file, with the keys of get_fields(nb_model):
+    the path, the label, the log posterior of each category of the model, and
+    the time in ms to read and score the file, which is the time of its chunk
+    divided by the size of the chunk
+    """
+    fields = get_fields(nb_model)
+    for chunk in service.get_chunks(util.walk_files_in_folder(folder), chunk_size):
+        start = time.perf_counter()
+        classify_results = classifier.classify_batch(chunk, nb_model, zeta, multinomial_coef)
+        ms = 1000*(time.perf_counter() - start)/len(chunk)
+        for f, (label, log_posterior) in zip(chunk, classify_results):
+            yield dict(zip(fields, [f, label] + log_posterior + [ms]))
+
+def write_csv(rows, out, fields):
+    writer = csv.DictWriter(out, fields)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+
+def write_jsonl(rows, out, fields):
+    for row in rows:
+        out.write(json.dumps(row) + '\n')
+
+WRITERS = {'csv': write_csv, 'jsonl': write_jsonl}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Classify every email below a folder")
+    parser.add_argument('folder')
+    parser.add_argument('--model', help="model file written by model.save_model; "
+                                        "trains on data/spam and data/ham if not given")
+    parser.add_argument('--format', choices=sorted(WRITERS), default='csv')
+    parser.add_argument('--output', help="file to write the results to, standard output if not given")
+    parser.add_argument('--zeta', type=float, default=1.0)
+    parser.add_argument('--chunk-size', type=int, default=1024)
+    args = parser.parse_args()
+
+    if args.model is not None:
+        nb_model = model.load_model(args.model)
+    else:
+        file_lists = [util.get_files_in_folder("data/spam"), util.get_files_in_folder("data/ham")]
+        # keep the progress messages of training out of the results
+        with contextlib.redirect_stdout(sys.stderr):
+            nb_model = classifier.learn_model(file_lists, [0.5, 0.5])
+
+    rows = score_folder(args.folder, nb_model, args.zeta, args.chunk_size)
+    if args.output is None:
+        WRITERS[args.format](rows, sys.stdout, get_fields(nb_model))
+    else:
+        with open(args.output, 'w', newline='') as out:
+            WRITERS[args.format](rows, out, get_fields(nb_model))
@@ -0,0 +1,70 @@
+import numpy as np
+import vectorizer
+
+def get_document_frequencies(count_matrix, labels, num_categories):
+    """
+    Returns a num_categories x len(vocabulary) array, whose [k, j] entry is
+    the number of documents of category k that contain word j
+    """
+    presence = count_matrix.copy()
+    presence.sum_duplicates()
+    presence.data[:] = 1
+    return vectorizer.get_class_counts(presence, labels, num_categories)
+
+def get_contingency_tables(count_matrix, labels, num_categories):
+    """
+    Returns a 2 x num_categories x len(vocabulary) array of document counts:
+    [1, k, j] documents of category k containing word j, and [0, k, j] those
+    not containing it
+    """
+    present = get_document_frequencies(count_matrix, labels, num_categories)
+    documents_per_category = np.bincount(labels, minlength=num_categories)
+    absent = documents_per_category[:, np.newaxis] - present
+    return np.stack([absent, present]).astype(np.float64)
+
+def mutual_information(count_matrix, labels, num_categories=2):
+    """
+    Returns the mutual information (in bits) between the presence of each
+    word in a document and the category of the document, for every word
+    """
+    observed = get_contingency_tables(count_matrix, labels, num_categories)
+    joint = observed/len(labels)
+    expected = joint.sum(axis=1, keepdims=True)*joint.sum(axis=0, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = joint*np.log2(joint/expected)
+    return np.nansum(terms, axis=(0, 1))
+
+def chi_squared(count_matrix, labels, num_categories=2):
+    """
+    Returns the chi-squared statistic of independence between the presence
+    of each word in a document and the category of the document, for every word
+    """
+    observed = get_contingency_tables(count_matrix, labels, num_categories)
+    expected = observed.sum(axis=1, keepdims=True)*observed.sum(axis=0, keepdims=True)/len(labels)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = (observed - expected)**2/expected
+    return np.nansum(terms, axis=(0, 1))
+
+SCORES = {'mutual_information': mutual_information, 'chi_squared': chi_squared}
+
+def select_features(count_matrix, labels, num_categories, num_features, method='mutual_information'):
+    """
+    Rank the words by method ('mutual_information' or 'chi_squared') and
+    return the ids of the num_features best ones, in increasing id order
+    """
+    if method not in SCORES:
+        raise ValueError("Unknown feature selection method: %s" % method)
+    scores = SCORES[method](count_matrix, labels, num_categories)
+    if num_features >= len(scores):
+        return np.arange(len(scores))
+    # stable sort, so ties keep the words seen first
+    best = np.argsort(-scores, kind='mergesort')[:num_features]
+    return np.sort(best)
+
+def prune_vocabulary(vocabulary, count_matrix, word_ids):
+    """
+    Keep only the words with the given ids. Returns a tuple (vocabulary,
+    count_matrix) of a new Vocabulary and the matching columns of count_matrix
+    """
+    pruned = vectorizer.Vocabulary(vocabulary.words[j] for j in word_ids)
+    return (pruned, count_matrix[:, word_ids])
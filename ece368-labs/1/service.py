@@ -0,0 +1,90 @@
+from collections import deque
+from multiprocessing import Pool, shared_memory
+import os
+import classifier
+import model
+
+# the model of a worker process, attached in _attach_model
+_worker_memory = None
+_worker_model = None
+
+def share_model(nb_model):
+    """
+    Copy nb_model, in the binary format of model.save_model, into a new
+    multiprocessing.shared_memory block and return the block. The caller must
+    close() and unlink() it when done.
+    """
+    data = model.serialize_model(nb_model)
+    memory = shared_memory.SharedMemory(create=True, size=len(data))
+    memory.buf[:len(data)] = data
+    return memory
+
+def attach_model(name):
+    """
+    Attach to the shared memory block name made by share_model. Returns a
+    tuple (memory, nb_model) in which the arrays and vocabulary of nb_model
+    are views into the block, so nothing is copied.
+    """
+    memory = shared_memory.SharedMemory(name=name)
+    return (memory, model.load_model_from_buffer(memory.buf))
+
+def _attach_model(name):
+    """ Pool initializer: attach the worker to the shared model """
+    global _worker_memory, _worker_model
+    _worker_memory, _worker_model = attach_model(name)
+
+def _classify_chunk(args):
+    """ Score one chunk of files in a worker with the shared model """
+    file_list, zeta, multinomial_coef = args
+    return classifier.classify_batch(file_list, _worker_model, zeta, multinomial_coef)
+
+def get_chunks(file_list, chunk_size):
+    """ Yields consecutive lists of at most chunk_size files from the iterable file_list """
+    chunk = []
+    for f in file_list:
+        chunk.append(f)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def classify_parallel(file_list, nb_model, zeta=1, workers=None, chunk_size=256, multinomial_coef='lgamma'):
+    """
+    Classify the files of file_list (any iterable) with a pool of worker
+    processes, which all read the model from one shared memory block
+
+    Input
+    -----
+    file_list: iterable of files (or corpus.PackedDocuments) to classify
+    nb_model: output of classifier.learn_model or model.load_model
+    zeta, multinomial_coef: see classifier.classify_batch
+    workers: number of worker processes, None for one per CPU
+    chunk_size: number of files a worker scores with one classify_batch call
+
+    Output
+    ------
+    A generator of (file, classify_result) tuples in the order of file_list,
+    with classify_result as returned by classifier.classify_new_email.
+    Results are yielded as soon as their chunk is scored, and at most two
+    chunks per worker are in flight, so file_list is consumed lazily.
+    """
+    workers = workers or os.cpu_count()
+    memory = share_model(nb_model)
+    try:
+        with Pool(workers, initializer=_attach_model, initargs=(memory.name,)) as pool:
+            in_flight = deque()
+            for chunk in get_chunks(file_list, chunk_size):
+                in_flight.append((chunk, pool.apply_async(_classify_chunk, ((chunk, zeta, multinomial_coef),))))
+                if len(in_flight) < 2*workers:
+                    continue
+                chunk, classify_results = in_flight.popleft()
+                for f, classify_result in zip(chunk, classify_results.get()):
+                    yield (f, classify_result)
+            while in_flight:
+                chunk, classify_results = in_flight.popleft()
+                for f, classify_result in zip(chunk, classify_results.get()):
+                    yield (f, classify_result)
+    finally:
+        memory.close()
+        memory.unlink()
@@ -1,25 +1,169 @@
+import hashlib
 import os
+from array import array
+import corpus
+import instrument
 
-def get_words_in_file(filename):
-    """ Returns a list of all words in the file at filename. """
-    with open(filename, 'r', encoding = "ISO-8859-1") as f:
-        # read() reads in a string from a file pointer, and split() splits a
-        # string into words based on whitespace
-        words = f.read().split()
+# str.split() splits ISO-8859-1 text on these characters besides the ASCII
+# whitespace that bytes.split() splits on, so they are mapped to spaces first
+LATIN_1_WHITESPACE_TABLE = bytes.maketrans(b'\x1c\x1d\x1e\x1f\x85\xa0', b'      ')
+
+def get_words_in_file(filename, tokenizer='str'):
+    """ 
+    Returns a list of all words in the file at filename. 
+    filename can also be a corpus.PackedDocument, whose bytes are split instead.
+    tokenizer is 'str', which decodes the file and splits the text, or 'bytes',
+    which splits the raw bytes with get_byte_words_in_file and decodes only
+    the words. Both give exactly the same words.
+    """
+    if tokenizer == 'bytes':
+        words = get_byte_words_in_file(filename)
+        with instrument.stage('tokenize'):
+            return [w.decode("ISO-8859-1") for w in words]
+    if tokenizer != 'str':
+        raise ValueError("Unknown tokenizer: %s" % tokenizer)
+    if isinstance(filename, corpus.PackedDocument):
+        with instrument.stage('tokenize') as stage:
+            stage.add_bytes(len(filename.data))
+            return str(filename.data, "ISO-8859-1").split()
+    with instrument.stage('read') as stage:
+        with open(filename, 'r', encoding = "ISO-8859-1") as f:
+            # read() reads in a string from a file pointer, and split() splits a
+            # string into words based on whitespace
+            text = f.read()
+        stage.add_bytes(len(text))
+    with instrument.stage('tokenize') as stage:
+        stage.add_bytes(len(text))
+        words = text.split()
     return words
 
+def get_bytes_in_file(filename):
+    """ Returns the raw bytes of the file at filename, or of a corpus.PackedDocument """
+    with instrument.stage('read') as stage:
+        if isinstance(filename, corpus.PackedDocument):
+            data = bytes(filename.data)
+        else:
+            with open(filename, 'rb') as f:
+                data = f.read()
+        stage.add_bytes(len(data))
+    return data
+
+def get_byte_words_in_file(filename):
+    """
+    Returns a list of all words in the file at filename as bytes, without
+    decoding the file. Splits on exactly the same characters as 
+    get_words_in_file, so the words are those of get_words_in_file encoded
+    as ISO-8859-1.
+    """
+    data = get_bytes_in_file(filename)
+    with instrument.stage('tokenize') as stage:
+        stage.add_bytes(len(data))
+        return data.translate(LATIN_1_WHITESPACE_TABLE).split()
+
+def get_word_ids_in_file(filename, vocabulary, ids=None, grow=True):
+    """
+    Tokenize the file at filename on raw bytes, interning the words through 
+    vocabulary, a dict whose keys are words as bytes and whose values are
+    integer ids. New words get the id len(vocabulary) if grow is True, and are
+    skipped otherwise. The ids of the words are appended to ids, an 
+    array('I') (a new one if ids is None), which is returned.
+    """
+    if ids is None:
+        ids = array('I')
+    append = ids.append
+    get = vocabulary.get
+    words = get_byte_words_in_file(filename)
+    with instrument.stage('count'):
+        for w in words:
+            word_id = get(w)
+            if word_id is None:
+                if not grow:
+                    continue
+                word_id = vocabulary[w] = len(vocabulary)
+            append(word_id)
+    return ids
+
+def get_document_name(filename):
+    """ Returns the path of a file, or the name of a corpus.PackedDocument """
+    if isinstance(filename, corpus.PackedDocument):
+        return filename.name
+    return filename
+
 def get_files_in_folder(folder):
-    """ Returns a list of files in folder (including the path to the file) """
+    """ 
+    Returns a list of files in folder (including the path to the file) 
+    If folder is a packed corpus (see corpus.pack_folder), returns its
+    corpus.PackedDocuments instead, which can be used wherever a file can.
+    """
+    if corpus.is_packed_corpus(folder):
+        return list(corpus.PackedCorpus(folder))
     filenames = os.listdir(folder)
     # os.path.join combines paths while dealing with /s and \s appropriately
     full_filenames = [os.path.join(folder, filename) for filename in filenames]
     return full_filenames
 
-def get_counts(file_list):
+def get_file_lists_by_folder(folder):
+    """
+    Returns a tuple (categories, file_lists_by_category) for a folder with
+    one subfolder (or packed corpus) of files per category: the sorted names
+    of the subfolders, and the list of files in each of them
+    """
+    categories = sorted(entry.name for entry in os.scandir(folder)
+                        if entry.is_dir() or corpus.is_packed_corpus(entry.path))
+    file_lists = [get_files_in_folder(os.path.join(folder, category)) for category in categories]
+    return (categories, file_lists)
+
+def walk_files_in_folder(folder):
+    """
+    Yields the files in folder and all its subfolders (including the path to
+    the file), without ever listing a whole folder at once. Folders are read
+    lazily with os.scandir, in no particular order, and symbolic links to
+    folders are not followed.
+    """
+    folders = [folder]
+    while folders:
+        with os.scandir(folders.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(entry.path)
+                elif entry.is_file():
+                    yield entry.path
+
+def get_names_fingerprint(names):
+    """
+    Returns a tuple (number of names, sha1 digest of the names) that
+    identifies the sequence names without keeping it
+    """
+    h = hashlib.sha1()
+    num_names = 0
+    for name in names:
+        h.update(name.encode('utf-8', 'surrogatepass'))
+        h.update(b'\n')
+        num_names += 1
+    return (num_names, h.digest())
+
+def check_index(index, file_list):
+    """
+    Raise a ValueError unless index (an index.InvertedIndex) was built over
+    exactly file_list. The names of file_list are hashed and compared with
+    the fingerprint the index computed once, so no list of names is built;
+    a file_list of another length is rejected without hashing it.
+    """
+    if len(file_list) != index.fingerprint[0] or \
+            get_names_fingerprint(get_document_name(f) for f in file_list) != index.fingerprint:
+        raise ValueError("The index was not built over the given files")
+
+def get_counts(file_list, index=None):
     """ 
     Returns a dict whose keys are words and whose values are the number of 
     files in file_list the key occurred in. 
+    If index is an index.InvertedIndex built over file_list, it is used 
+    instead of reading the files (a ValueError is raised if it was built over
+    other files).
     """
+    if index is not None:
+        check_index(index, file_list)
+        return index.get_counts()
     counts = Counter()
     for f in file_list:
         words = get_words_in_file(f)
@@ -27,10 +171,16 @@ def get_counts(file_list):
             counts[w] += 1
     return counts
 
-def get_word_freq(file_list):
+def get_word_freq(file_list, index=None):
     """ 
     Returns a dict whose keys are words and whose values are word freq
+    If index is an index.InvertedIndex built over file_list, it is used 
+    instead of reading the files (a ValueError is raised if it was built over
+    other files).
     """
+    if index is not None:
+        check_index(index, file_list)
+        return index.get_word_freq()
     counts = Counter()
     for f in file_list:
         words = get_words_in_file(f)
@@ -41,16 +191,21 @@ def get_word_freq(file_list):
 def exists_in_list(word_list, word):
     """
     Returns true if word exists in the list, returns false if doesnt
+    word_list can also be a set, a dict or an index.InvertedIndex, which
+    are checked in O(1)
     """
-    for w in word_list:
-        if(w == word):
-            return True
-    return False
+    return word in word_list
 
-def word_count_in_file_list(file_list, key_word):
+def word_count_in_file_list(file_list, key_word, index=None):
     """
     Returns how many times a word comes up in a list of files
+    If index is an index.InvertedIndex built over file_list, it is used 
+    instead of reading the files (a ValueError is raised if it was built over
+    other files).
     """
+    if index is not None:
+        check_index(index, file_list)
+        return index.word_count(key_word)
     count = 0
     for f in file_list:
         words = get_words_in_file(f)
@@ -59,10 +214,16 @@ def word_count_in_file_list(file_list, key_word):
                 count += 1  
     return count
 
-def get_total_word_count(file_list):
+def get_total_word_count(file_list, index=None):
     """
     Returns total number of words in a list of files
+    If index is an index.InvertedIndex built over file_list, it is used 
+    instead of reading the files (a ValueError is raised if it was built over
+    other files).
     """
+    if index is not None:
+        check_index(index, file_list)
+        return index.total_word_count
     count = 0
     for f in file_list:
         words = get_words_in_file(f)
@@ -70,6 +231,30 @@ def get_total_word_count(file_list):
             count += 1
     return count
 
+def count_words_by_category(file_lists_by_category):
+    """
+    Tokenizes every file exactly once and returns a tuple with three elements
+    First element is the vocabulary, a dict whose keys are all words seen in any category
+    Second element is a list with one word count dict (a Counter) per category
+    Third element is a list with the total number of words in each category
+    """
+    vocabulary = dict()
+    word_counts_by_category = []
+    total_counts_by_category = []
+    for file_list in file_lists_by_category:
+        counts = Counter()
+        total = 0
+        for f in file_list:
+            words = get_words_in_file(f)
+            total += len(words)
+            for w in words:
+                counts[w] += 1
+        for w in counts:
+            vocabulary[w] = 1
+        word_counts_by_category.append(counts)
+        total_counts_by_category.append(total)
+    return (vocabulary, word_counts_by_category, total_counts_by_category)
+
 class Counter(dict):
     """
     Like a dict, but returns 0 if the key isn't found.
@@ -1,4 +1,46 @@
 import numpy as np
+from scipy import linalg, special
+
+# covariance matrix (as shape and bytes) -> (Cholesky factor, log determinant)
+_cholesky_cache = {}
+CHOLESKY_CACHE_SIZE = 32
+
+def get_cholesky(covariance_mat):
+    """ Return the tuple (L, log_det) of the lower Cholesky factor L of
+        covariance_mat (covariance_mat = L L^T) and the natural log of its
+        determinant, 2*sum(log(diag(L))). Factorizations are cached, so
+        repeated calls with the same covariance (e.g. the shared covariance
+        of LDA) factor it only once.
+    """
+    covariance_mat = np.ascontiguousarray(covariance_mat, dtype=np.float64)
+    key = (covariance_mat.shape, covariance_mat.tobytes())
+    factor = _cholesky_cache.get(key)
+    if factor is None:
+        L = np.linalg.cholesky(covariance_mat)
+        L.setflags(write=False)
+        factor = (L, 2*np.sum(np.log(np.diag(L))))
+        if len(_cholesky_cache) >= CHOLESKY_CACHE_SIZE:
+            _cholesky_cache.pop(next(iter(_cholesky_cache)))
+        _cholesky_cache[key] = factor
+    return factor
+
+def log_density_Gaussian(mean_vec,covariance_mat,x_set):
+    """ Return the natural log of the density of multivariate Gaussian
+        distribution, with the same inputs as density_Gaussian. Does not
+        underflow where the density itself does (high dimensions or samples
+        far from the mean).
+
+        All the samples are evaluated at once: with the Cholesky factor L of
+        the covariance (see get_cholesky), the Mahalanobis distance of x is
+        |z|^2 where L z = x - mean_vec, so one triangular solve over the
+        whole set replaces the inverse.
+    """
+    x_set = np.asarray(x_set, dtype=np.float64)
+    d = x_set.shape[1]
+    L, log_det_Sigma = get_cholesky(covariance_mat)
+    z = linalg.solve_triangular(L, (x_set - np.asarray(mean_vec).ravel()).T, lower=True)
+    mahalanobis = np.einsum('ij,ij->j', z, z)
+    return -0.5*(mahalanobis + d*np.log(2*np.pi) + log_det_Sigma)
 
 def density_Gaussian(mean_vec,covariance_mat,x_set):
     """ Return the density of multivariate Gaussian distribution
@@ -8,6 +50,35 @@ def density_Gaussian(mean_vec,covariance_mat,x_set):
             x_set is a 2D array, each row is a sample
         Output:
             a 1D array, probability density evaluated at the samples in x_set.
+
+        Computed for all the samples at once, see log_density_Gaussian.
+    """
+    return np.exp(log_density_Gaussian(mean_vec, covariance_mat, x_set))
+
+def log_posterior_Gaussian(mean_vecs,covariance_mats,priors,x_set):
+    """ Return the natural log posteriors log p(y=k|x) of a Gaussian
+        discriminant model with K classes
+        Inputs:
+            mean_vecs is a list of K mean vectors
+            covariance_mats is a list of K covariance matrices; pass the same
+            matrix K times for LDA, and one per class for QDA
+            priors is a list of K prior probabilities
+            x_set is a 2D array, each row is a sample
+        Output:
+            a N x K 2D array, whose row i holds the log posteriors of sample i.
+            The class of sample i is the argmax of row i.
+
+        The joint log probabilities log p(x|y=k) + log p(y=k) are normalized
+        with log-sum-exp, which subtracts the largest term of every row before
+        exponentiating, so nothing underflows.
+    """
+    log_joint = np.column_stack([log_density_Gaussian(mean_vec, covariance_mat, x_set) + np.log(prior)
+                                 for mean_vec, covariance_mat, prior in zip(mean_vecs, covariance_mats, priors)])
+    return log_joint - special.logsumexp(log_joint, axis=1, keepdims=True)
+
+def density_Gaussian_loop(mean_vec,covariance_mat,x_set):
+    """ Same as density_Gaussian, one sample at a time. Kept as the reference
+        that density_Gaussian is checked and benchmarked against.
     """
     d = x_set.shape[1]  
     inv_Sigma = np.linalg.inv(covariance_mat)
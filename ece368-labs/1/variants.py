@@ -0,0 +1,122 @@
+from collections import namedtuple
+import numpy as np
+import vectorizer
+import classifier
+import selection
+
+class LinearModel(namedtuple('LinearModel', ['name', 'categories', 'vocabulary', 'weights', 'bias', 'binary'])):
+    """
+    A Naive Bayes variant in the form every variant shares when written in
+    log space: the score of category k for a document with feature vector x
+    is x @ weights[k] + bias[k], and the document goes to the category with
+    the highest score. All logs are base 10.
+
+    name: 'multinomial', 'bernoulli' or 'complement'
+    categories: tuple of category names, e.g. ('spam', 'ham')
+    vocabulary: a vectorizer.Vocabulary mapping words to column ids
+    weights: K x len(vocabulary) read-only array
+    bias: read-only array of length K
+    binary: if True, x holds 1 for every word present in the document
+    instead of its count (the Bernoulli model)
+    """
+    __slots__ = ()
+
+def make_linear_model(name, categories, vocabulary, weights, bias, binary=False):
+    weights = np.asarray(weights, dtype=np.float64)
+    bias = np.asarray(bias, dtype=np.float64)
+    weights.setflags(write=False)
+    bias.setflags(write=False)
+    return LinearModel(name, tuple(categories), vocabulary, weights, bias, binary)
+
+def train_multinomial(vocabulary, count_matrix, labels, prior_by_category, categories=('spam', 'ham'), alpha=1):
+    """
+    The multinomial model of classifier.learn_model: weights[k] = log p(w|y=k)
+    and bias[k] = log p(y=k). Its scores leave out the multinomial coefficient,
+    which is the same for every category.
+    """
+    class_counts = vectorizer.get_class_counts(count_matrix, labels, len(categories))
+    return make_linear_model('multinomial', categories, vocabulary,
+                             np.log10(classifier.smooth_class_counts(class_counts, alpha)),
+                             np.log10(prior_by_category))
+
+def train_bernoulli(vocabulary, count_matrix, labels, prior_by_category, categories=('spam', 'ham'), alpha=1):
+    """
+    The Bernoulli model, in which every word of the vocabulary is present in a
+    document of category k or not, with probability
+    theta[k, j] = (documents of k containing word j + alpha)/(documents of k + 2*alpha)
+
+    log p(x|y=k) = sum_j x_j log theta[k, j] + (1 - x_j) log(1 - theta[k, j])
+    is linear in the presence vector x, with weights log theta - log(1 - theta)
+    and bias sum_j log(1 - theta[k, j]) + log p(y=k).
+    """
+    num_categories = len(categories)
+    document_frequencies = selection.get_document_frequencies(count_matrix, labels, num_categories)
+    documents_per_category = np.bincount(labels, minlength=num_categories)
+    theta = (document_frequencies + alpha)/(documents_per_category + 2*alpha)[:, np.newaxis]
+    log_absent = np.log10(1 - theta)
+    return make_linear_model('bernoulli', categories, vocabulary, np.log10(theta) - log_absent,
+                             log_absent.sum(axis=1) + np.log10(prior_by_category), binary=True)
+
+def train_complement(vocabulary, count_matrix, labels, prior_by_category, categories=('spam', 'ham'), alpha=1):
+    """
+    The complement model of Rennie et al. (2003), which estimates the word
+    probabilities of every category from the documents of all the other
+    categories, and scores a category by how badly its complement explains
+    the document: weights[k] = -log p(w|y!=k) and bias[k] = log p(y=k)
+    """
+    class_counts = vectorizer.get_class_counts(count_matrix, labels, len(categories))
+    complement_counts = class_counts.sum(axis=0) - class_counts
+    return make_linear_model('complement', categories, vocabulary,
+                             -np.log10(classifier.smooth_class_counts(complement_counts, alpha)),
+                             np.log10(prior_by_category))
+
+TRAINERS = {'multinomial': train_multinomial, 'bernoulli': train_bernoulli, 'complement': train_complement}
+
+def train_variants(vocabulary, count_matrix, labels, prior_by_category, categories=('spam', 'ham'),
+                   names=('multinomial', 'bernoulli', 'complement'), alpha=1):
+    """
+    Train every variant in names from one document-term matrix, the output of
+    vectorizer.get_count_matrix_by_category, so the files are tokenized only
+    once. Returns a dict whose keys are the names and whose values are
+    LinearModels.
+    """
+    for name in names:
+        if name not in TRAINERS:
+            raise ValueError("Unknown Naive Bayes variant: %s" % name)
+    return {name: TRAINERS[name](vocabulary, count_matrix, labels, prior_by_category, categories, alpha)
+            for name in names}
+
+def score_count_matrix(linear_model, count_matrix):
+    """
+    Returns the N x K array of scores of the N documents in count_matrix,
+    which must have been built against linear_model.vocabulary
+    """
+    if linear_model.binary:
+        count_matrix = count_matrix.copy()
+        count_matrix.sum_duplicates()
+        count_matrix.data[:] = 1
+    return count_matrix @ linear_model.weights.T + linear_model.bias
+
+def classify_count_matrix(linear_model, count_matrix):
+    """ Returns the category index with the highest score for every document in count_matrix """
+    return np.argmax(score_count_matrix(linear_model, count_matrix), axis=1)
+
+def classify_batch(file_list, linear_models):
+    """
+    Classify all the files in file_list under every model in linear_models, a
+    dict of LinearModels sharing one vocabulary (as made by train_variants).
+    The files are tokenized once and every model costs one sparse-dense
+    matrix product.
+
+    Output
+    ------
+    A dict whose keys are those of linear_models and whose values are arrays
+    with the predicted category index of every file
+    """
+    vocabularies = set(id(linear_model.vocabulary) for linear_model in linear_models.values())
+    if len(vocabularies) != 1:
+        raise ValueError("The models do not share one vocabulary")
+    vocabulary = next(iter(linear_models.values())).vocabulary
+    count_matrix = vectorizer.get_count_matrix(vectorizer.get_word_counts(file_list), vocabulary, grow=False)
+    return {name: classify_count_matrix(linear_model, count_matrix)
+            for name, linear_model in linear_models.items()}
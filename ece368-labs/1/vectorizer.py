@@ -0,0 +1,201 @@
+import zlib
+import numpy as np
+from scipy import sparse
+import util
+import instrument
+
+class Vocabulary(dict):
+    """
+    A dict whose keys are words and whose values are integer word ids.
+    Ids are handed out as 0, 1, 2, ... in the order words are first added, and
+    words[i] is the word whose id is i.
+    """
+    def __init__(self, words=()):
+        dict.__init__(self)
+        self.words = []
+        for w in words:
+            self.add(w)
+
+    def add(self, word):
+        """ Returns the id of word, giving it the next free id if it is new """
+        word_id = self.get(word)
+        if word_id is None:
+            word_id = len(self.words)
+            self[word] = word_id
+            self.words.append(word)
+        return word_id
+
+class VocabularyPrefix(object):
+    """
+    A read-only view of the first size words of a Vocabulary. Words only
+    ever get appended to a Vocabulary, so the view keeps its ids and size
+    while the Vocabulary grows, and no words are copied to make it.
+    """
+    def __init__(self, vocabulary, size=None):
+        self.vocabulary = vocabulary
+        self.size = len(vocabulary) if size is None else size
+
+    def __len__(self):
+        return self.size
+
+    def get(self, word, default=None):
+        """ Returns the id of word, or default if it is not in the view """
+        word_id = self.vocabulary.get(word)
+        if word_id is None or word_id >= self.size:
+            return default
+        return word_id
+
+    def __getitem__(self, word):
+        word_id = self.get(word)
+        if word_id is None:
+            raise KeyError(word)
+        return word_id
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+    def __iter__(self):
+        return iter(self.vocabulary.words[:self.size])
+
+    @property
+    def words(self):
+        return self.vocabulary.words[:self.size]
+
+class HashingVocabulary(object):
+    """
+    A fixed-size replacement for Vocabulary (the hashing trick): every word
+    maps to one of 2**num_bits buckets by the CRC-32 of its utf-8 bytes, so
+    no words are stored and a model has 2**num_bits columns however large
+    the corpus is. Words sharing a bucket share their counts.
+    """
+    def __init__(self, num_bits=18):
+        self.num_bits = num_bits
+        self.mask = (1 << num_bits) - 1
+
+    def __len__(self):
+        return self.mask + 1
+
+    def __contains__(self, word):
+        return True
+
+    def get(self, word, default=None):
+        """ Returns the bucket of word """
+        return zlib.crc32(word.encode('utf-8')) & self.mask
+
+    add = get
+    __getitem__ = get
+
+def get_word_counts(file_list):
+    """
+    Yields one dict per file in file_list, whose keys are the words in the file
+    and whose values are the number of times the word occurs in it.
+    Each file is read and split exactly once.
+    """
+    for f in file_list:
+        words = util.get_words_in_file(f)
+        with instrument.stage('count'):
+            counts = util.Counter()
+            for w in words:
+                counts[w] += 1
+        yield counts
+
+def get_count_matrix(word_counts, vocabulary, grow=True):
+    """
+    Build the document-term matrix of a corpus
+
+    Input
+    -----
+    word_counts: An iterable of dicts, one per document, mapping words to counts
+    (e.g. the output of get_word_counts).
+    vocabulary: A Vocabulary. If grow is True, unseen words are added to it;
+    otherwise they are dropped from the matrix. With a HashingVocabulary, 
+    words of a document which share a bucket give duplicate entries, which
+    scipy sums.
+
+    Output
+    ------
+    count_matrix: A scipy.sparse CSR matrix with one row per document and
+    len(vocabulary) columns, where count_matrix[i, j] is the number of times
+    the word with id j occurs in document i
+    """
+    indptr = [0]
+    indices = []
+    data = []
+    # word_counts may be a generator that reads and counts the files itself,
+    # so only the interning of every document is timed here
+    for counts in word_counts:
+        with instrument.stage('count'):
+            for w in counts:
+                if grow:
+                    word_id = vocabulary.add(w)
+                else:
+                    word_id = vocabulary.get(w)
+                    if word_id is None:
+                        continue
+                indices.append(word_id)
+                data.append(counts[w])
+            indptr.append(len(indices))
+
+    shape = (len(indptr) - 1, len(vocabulary))
+    return sparse.csr_matrix((np.array(data, dtype=np.int64),
+                              np.array(indices, dtype=np.int64),
+                              np.array(indptr, dtype=np.int64)), shape=shape)
+
+def get_count_matrix_by_category(file_lists_by_category, vocabulary=None):
+    """
+    Build one document-term matrix over the files of every category
+
+    Input
+    -----
+    file_lists_by_category: A list with one list of files per category.
+    vocabulary: An optional Vocabulary (or HashingVocabulary) to extend; a new
+    Vocabulary is created if None.
+
+    Output
+    ------
+    A tuple of three elements: (vocabulary, count_matrix, labels), in which
+    count_matrix has one row per file, in the order they appear in
+    file_lists_by_category, and labels[i] is the category index of row i
+    """
+    if vocabulary is None:
+        vocabulary = Vocabulary()
+
+    all_files = []
+    labels = []
+    for category, file_list in enumerate(file_lists_by_category):
+        all_files.extend(file_list)
+        labels.extend([category] * len(file_list))
+
+    count_matrix = get_count_matrix(get_word_counts(all_files), vocabulary)
+    return (vocabulary, count_matrix, np.array(labels, dtype=np.int64))
+
+def get_hashed_class_counts(file_lists_by_category, vocabulary):
+    """
+    Returns the num_categories x len(vocabulary) array of per-category word
+    counts of the files for a HashingVocabulary, the same as
+    get_count_matrix_by_category followed by get_class_counts. The counts
+    of each file are added to the array as soon as it is read, so memory
+    does not grow with the size of the corpus.
+    """
+    class_counts = np.zeros((len(file_lists_by_category), len(vocabulary)), dtype=np.int64)
+    for category, file_list in enumerate(file_lists_by_category):
+        for counts in get_word_counts(file_list):
+            with instrument.stage('count'):
+                buckets = np.fromiter((vocabulary.get(w) for w in counts), dtype=np.int64, count=len(counts))
+                np.add.at(class_counts[category], buckets,
+                          np.fromiter(counts.values(), dtype=np.int64, count=len(counts)))
+    return class_counts
+
+def get_class_counts(count_matrix, labels, num_categories):
+    """
+    Returns a num_categories x len(vocabulary) dense array, whose [k, j] entry
+    is the number of times word j occurs in the documents of category k.
+    This is a single sparse matrix product of a category indicator matrix with
+    count_matrix.
+    """
+    with instrument.stage('count'):
+        num_documents = count_matrix.shape[0]
+        indicator = sparse.csr_matrix((np.ones(num_documents, dtype=np.int64),
+                                       (labels, np.arange(num_documents))),
+                                      shape=(num_categories, num_documents))
+        return (indicator @ count_matrix).toarray()